@@ -0,0 +1,16 @@
+from enum import IntEnum
+
+
+class AppMode(IntEnum):
+    """
+    Pages the logged-in app can show, stored in st.session_state['app_mode'].
+    Defined outside the app script so the members stay the same objects across
+    reruns (the script's own globals are rebuilt on every rerun), which keeps
+    identity comparisons and dict lookups on them valid.
+    """
+    DASHBOARD = 0
+    UTILITIES = 1
+    TEACHER_AID = 2
+    USAGE_DASHBOARD = 3
+    PLAN_MANAGER = 4
+    DATA_CLEAN_UP = 5
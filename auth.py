@@ -2,9 +2,10 @@ import streamlit as st
 import json
 import os
 import hashlib
-import pandas as pd
 from typing import Dict, Any
 
+from storage_logic import flush_dirty_dbs
+
 # --- Constants ---
 USERS_FILE = "users.json"
 PLAN_OVERRIDES_FILE = "plan_overrides.csv" # Looking for CSV
@@ -23,8 +24,9 @@ def hash_password(password: str) -> str:
     """Hashes a password using SHA256."""
     return hashlib.sha256(password.encode()).hexdigest()
 
+@st.cache_data(ttl=60, show_spinner=False)
 def load_users() -> Dict[str, Any]:
-    """Loads user data from the JSON file."""
+    """Loads user data from the JSON file (cached; cleared by save_users)."""
     if not os.path.exists(USERS_FILE):
         return {}
     with open(USERS_FILE, "r") as f:
@@ -37,22 +39,34 @@ def save_users(users_data: Dict[str, Any]):
     """Saves user data to the JSON file."""
     with open(USERS_FILE, "w") as f:
         json.dump(users_data, f, indent=4)
+    load_users.clear() # Next read must see the new account
 
-def load_plan_overrides() -> Dict[str, str]:
-    """Loads plan overrides from the CSV file."""
+@st.cache_data(ttl=60, show_spinner=False)
+def read_plan_overrides() -> Dict[str, str]:
+    """
+    Parses the plan overrides CSV (cached). Pure: errors propagate to the caller
+    and are not cached, and UI feedback is left to load_plan_overrides.
+    """
     overrides = {}
     if os.path.exists(PLAN_OVERRIDES_FILE):
-        try:
-            df = pd.read_csv(PLAN_OVERRIDES_FILE, header=None, names=['email', 'tier_abbr'])
-            for _, row in df.iterrows():
-                email = str(row['email']).strip().lower()
-                tier_abbr = str(row['tier_abbr']).strip().lower()
-                full_tier_name = TIER_ABBREVIATION_MAP.get(tier_abbr, "Free Tier")
-                overrides[email] = full_tier_name
-            st.toast("Plan overrides loaded from CSV.", icon="✅") 
-        except Exception as e:
-            st.error(f"Error loading plan overrides from CSV: {e}", icon="🚫")
-            return {}
+        import pandas as pd # Only needed when an overrides file exists
+        df = pd.read_csv(PLAN_OVERRIDES_FILE, header=None, names=['email', 'tier_abbr'])
+        for _, row in df.iterrows():
+            email = str(row['email']).strip().lower()
+            tier_abbr = str(row['tier_abbr']).strip().lower()
+            full_tier_name = TIER_ABBREVIATION_MAP.get(tier_abbr, "Free Tier")
+            overrides[email] = full_tier_name
+    return overrides
+
+def load_plan_overrides() -> Dict[str, str]:
+    """Loads plan overrides from the CSV file."""
+    try:
+        overrides = read_plan_overrides()
+    except Exception as e:
+        st.error(f"Error loading plan overrides from CSV: {e}", icon="🚫")
+        return {}
+    if overrides:
+        st.toast("Plan overrides loaded from CSV.", icon="✅")
     return overrides
 
 # --- Authentication Functions ---
@@ -142,10 +156,13 @@ def render_login_page():
 
 def logout():
     """Logs out the current user."""
+    # Write pending changes while the user's email and dicts are still in session state
+    flush_dirty_dbs()
     st.session_state.logged_in = False
     st.session_state.pop('current_user', None)
     st.session_state.pop('storage', None)
     st.session_state.pop('utility_db', None)
     st.session_state.pop('teacher_db', None)
+    st.session_state.pop('_loaded_user', None)
     st.success("You have been logged out.")
     st.rerun()
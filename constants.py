@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+from app_modes import AppMode
+from utility_features import CATEGORY_OPTIONS, FEATURES_BY_CATEGORY
+
+# Static lookup tables for the app. Imported modules are executed once per
+# process, whereas streamlit_app.py re-runs top to bottom on every interaction.
+
+TIER_PRICES = {
+    "Free Tier": "Free", "28/1 Pro": "$7/month", "Teacher Pro": "$7/month",
+    "Universal Pro": "$12/month", "Unlimited": "$18/month"
+}
+TIER_ORDER = ("Free Tier", "28/1 Pro", "Teacher Pro", "Universal Pro", "Unlimited")
+# Feature lines per plan, joined into the Plan Manager table
+PLAN_BENEFITS = {
+    "Free Tier": ("Basic Access", "Limited Storage"),
+    "28/1 Pro": ("✅ Enhanced Storage", "✅ **28-in-1** Access", "❌ Teacher Aid"),
+    "Teacher Pro": ("✅ Enhanced Storage", "❌ 28-in-1 Access", "✅ **Teacher Aid**"),
+    "Universal Pro": ("✅ Enhanced Storage", "✅ Both Suites", "✅ Dedicated Support"),
+    "Unlimited": ("🌟 Everything", "🚀 Infinite Storage"),
+}
+# Plan Manager comparison table (column -> values in TIER_ORDER), built from the static maps above
+PLAN_TABLE = {
+    "Plan": list(TIER_ORDER),
+    "Price": [TIER_PRICES[plan] for plan in TIER_ORDER],
+    "Includes": [", ".join(benefit.replace("**", "") for benefit in PLAN_BENEFITS[plan]) for plan in TIER_ORDER],
+}
+# Sidebar plan line per tier, formatted once instead of on every rerun
+PLAN_LABELS = {tier: f"**Plan:** *{tier}*" for tier in TIER_ORDER}
+
+HISTORY_PAGE_SIZE = 10 # Saved-history rows rendered per page
+
+# Teacher Aid resource tags, used as tab names and as routing tags in prompts
+RESOURCE_TAGS = (
+    "Unit Overview", "Lesson Plan", "Vocabulary List",
+    "Worksheet", "Quiz", "Test"
+)
+# Widget-key suffix per resource tag, built once instead of str.replace() on every render
+RESOURCE_KEY_SUFFIXES = {tag: tag.replace(' ', '_') for tag in RESOURCE_TAGS}
+# Example prompt shown above each Teacher Aid generator
+TEACHER_EXAMPLE_PROMPTS = {
+    "Unit Overview": "Create a **Unit Overview** for 7th-grade history on ancient civilizations.",
+    "Lesson Plan": "Develop a **Lesson Plan** for a high school chemistry class covering chemical reactions.",
+    "Vocabulary List": "Generate a **Vocabulary List** for an English class on Shakespearean terminology.",
+    "Worksheet": "Provide a **Worksheet** for pre-algebra students practicing order of operations.",
+    "Quiz": "Make a **Quiz** on the basic functions of a plant cell.",
+    "Test": "Create a **Test** for a 9th-grade biology course on genetics.",
+}
+
+# (label, storage tracker usage key, TIER_LIMITS limit key) for each progress bar
+USAGE_BARS = (
+    ("Universal Storage", 'current_universal_storage', 'universal_storage_limit_bytes'),
+    ("28-in-1 Utility History", 'current_utility_storage', 'utility_storage_limit_bytes'),
+    ("Teacher Aid History", 'current_teacher_storage', 'teacher_storage_limit_bytes'),
+    # Placeholder/Mock: no tier defines a file limit yet, so this bar stays at 0%
+    ("File Uploads/Images", 'current_file_storage', 'file_upload_limit_bytes'),
+)
+USAGE_BAR_TEMPLATE = "**{label}:** {current:,} / {limit} Bytes"
+
+# Sidebar navigation pages (label, AppMode), shown as one radio; Logout is a separate button
+SIDEBAR_MENU = (
+    ("🖥️ Dashboard", AppMode.DASHBOARD),
+    ("📊 Usage Dashboard", AppMode.USAGE_DASHBOARD),
+    ("💳 Plan Manager", AppMode.PLAN_MANAGER),
+    ("🧹 Data Clean Up", AppMode.DATA_CLEAN_UP),
+)
+SIDEBAR_MODES = tuple(mode for _, mode in SIDEBAR_MENU)
+SIDEBAR_LABELS = {mode: label for label, mode in SIDEBAR_MENU}
+# Session key of the sidebar radio; holds the selected page, or None while a hub is open
+SIDEBAR_NAV_KEY = "sidebar_nav_radio"
+
+_DEFAULT_CATEGORY = CATEGORY_OPTIONS[0]
+# Session-state defaults applied after login. Classes are factories, so each
+# session gets its own mutable instance rather than a shared one.
+SESSION_DEFAULTS = {
+    'app_mode': AppMode.DASHBOARD,
+    # Latest output per feature, bounded to the most recently used features
+    '28_in_1_outputs': OrderedDict,
+    'selected_28_in_1_category': _DEFAULT_CATEGORY,
+    'selected_28_in_1_feature': FEATURES_BY_CATEGORY[_DEFAULT_CATEGORY][0],
+}
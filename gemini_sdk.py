@@ -0,0 +1,36 @@
+import streamlit as st
+
+# --- CRITICAL FIX: Robust Imports for Gemini SDK ---
+import google.generativeai as genai
+
+# Attempt to import necessary components from their most likely locations,
+# providing fallbacks in case of version mismatch/conflicts.
+
+try:
+    from google.generativeai import APIError # Primary location
+except ImportError:
+    try:
+        from google.generativeai.errors import APIError # Secondary location
+    except ImportError:
+        # Fallback: Define a generic exception to allow the rest of the code to function
+        class APIError(Exception):
+            """Generic fallback for missing APIError class."""
+            pass
+
+try:
+    from google.generativeai.types import GenerationConfig
+except ImportError:
+    # Fallback: Define a mock class if the official one is not found
+    class GenerationConfig:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+    st.warning("⚠️ Could not import 'GenerationConfig'. Using a mock class.")
+
+# Failures that only mean context caching is unavailable: an SDK without
+# genai.caching, an instruction below the model's caching minimum, or a
+# reused cache that expired before it could be extended.
+try:
+    from google.api_core.exceptions import InvalidArgument, NotFound
+    CACHE_UNAVAILABLE_ERRORS = (AttributeError, InvalidArgument, NotFound)
+except ImportError:
+    CACHE_UNAVAILABLE_ERRORS = (AttributeError,)
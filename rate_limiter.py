@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, Optional, Tuple
+
+WINDOW_SECONDS = 60.0
+
+
+RATE_LIMIT_ERROR_NAMES = frozenset({"ResourceExhausted", "TooManyRequests"})
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """
+    True for quota/429 failures, whichever SDK exception class carries them.
+    Only the class name or a numeric HTTP status counts; the message is not
+    searched, since "429" can turn up in unrelated text such as token counts.
+    """
+    if type(exc).__name__ in RATE_LIMIT_ERROR_NAMES:
+        return True
+    for attr in ("code", "status_code"):
+        status = getattr(exc, attr, None)
+        if isinstance(status, int) and status == 429:
+            return True
+    return False
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide guard for Gemini calls. Requests and (estimated) tokens are
+    counted over a sliding 60 second window against the RPM/TPM quota, and the
+    number of calls allowed in flight adapts AIMD-style: it grows by `increase`
+    after each success and is multiplied by `decrease_factor` after a 429,
+    staying within [min_concurrency, max_concurrency]. Callers block until a
+    slot is free, so repeated clicks queue up instead of piling onto the API.
+    """
+
+    def __init__(self, rpm: int, tpm: int, min_concurrency: int = 1, max_concurrency: int = 8,
+                 increase: float = 0.5, decrease_factor: float = 0.5):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.concurrency = float(max_concurrency)
+        self._cond = threading.Condition()
+        self._window: Deque[Tuple[float, int]] = deque() # (start time, estimated tokens)
+        self._window_tokens = 0
+        self._active = 0
+
+    def _wait_seconds(self, now: float, tokens: int) -> Optional[float]:
+        """0 when a call may start now, None to wait for a release, else seconds to sleep."""
+        while self._window and self._window[0][0] <= now - WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+        if self._active >= int(self.concurrency):
+            return None
+        # A single oversized request is still let through once the window is empty
+        if len(self._window) >= self.rpm or (self._window and self._window_tokens + tokens > self.tpm):
+            return self._window[0][0] + WINDOW_SECONDS - now
+        return 0
+
+    def acquire(self, tokens: int = 0):
+        """Blocks until the concurrency limit and the RPM/TPM window admit another call."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_seconds(now, tokens)
+                if wait == 0:
+                    break
+                self._cond.wait(wait)
+            self._active += 1
+            self._window.append((now, tokens))
+            self._window_tokens += tokens
+
+    def release(self, rate_limited: Optional[bool]):
+        """Frees a slot; True shrinks the concurrency limit, False grows it, None leaves it."""
+        with self._cond:
+            self._active -= 1
+            if rate_limited:
+                self.concurrency = max(self.min_concurrency, self.concurrency * self.decrease_factor)
+            elif rate_limited is not None:
+                self.concurrency = min(self.max_concurrency, self.concurrency + self.increase)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: int = 0) -> Iterator[None]:
+        """Holds one call slot for the duration of the block."""
+        self.acquire(tokens)
+        rate_limited = None
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limit_error(e):
+                rate_limited = True
+            raise
+        else:
+            rate_limited = False
+        finally:
+            # Script stop/rerun signals release the slot without adjusting the limit
+            self.release(rate_limited)
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Tuple, Union
+
+
+class RequestCoalescer:
+    """
+    Shares one in-flight call between callers that submit the same request key.
+    The first caller (the leader) runs the work; callers arriving while it is
+    still running wait for and reuse its result instead of issuing their own call.
+    Thread-safe, so a single instance can be shared by all Streamlit sessions.
+
+    With a positive `ttl` (seconds), successful results are also kept for that
+    long, up to `max_entries` keys (least recently used dropped), so repeats of a
+    finished request are answered without running it again. Failures are never
+    kept, nor are results of calls made with cache=False, which are only shared
+    with callers already waiting (for requests meant to vary, like a random fact).
+
+    Waiting callers give up after `follower_timeout` seconds and make the call
+    themselves, so a stuck leader never blocks them for good.
+    """
+
+    def __init__(self, ttl: float = 0, max_entries: int = 128, follower_timeout: float = 120):
+        self._lock = threading.Lock()
+        self._follower_timeout = follower_timeout
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict() # key -> (expires at, result)
+
+    def _cached_result(self, key: Hashable) -> Tuple[bool, Any]:
+        """(True, result) for a live cached result, else (False, None). Caller holds the lock."""
+        entry = self._results.get(key)
+        if entry is None:
+            return False, None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._results[key]
+            return False, None
+        self._results.move_to_end(key)
+        return True, result
+
+    def _store_result(self, key: Hashable, result: Any):
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._results[key] = (time.monotonic() + self._ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self._max_entries:
+                self._results.popitem(last=False)
+
+    def _follow(self, future: Future, fallback: Callable[[], Any]) -> Any:
+        """Waits for the leader's result, or calls fallback() if it stopped or is too slow."""
+        try:
+            return future.result(timeout=self._follower_timeout)
+        except (CancelledError, FutureTimeoutError):
+            # The leader's session stopped before finishing, or it is stuck; do the work ourselves
+            return fallback()
+
+    def run(self, key: Hashable, work: Callable[[], Any], cache: bool = True) -> Any:
+        """Returns work()'s result, running it only if no identical call is in flight or cached."""
+        with self._lock:
+            hit, result = self._cached_result(key)
+            if hit:
+                return result
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return self._follow(future, work)
+
+        try:
+            result = work()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Script stop/rerun signals belong to the leader's session only
+            future.cancel()
+            raise
+        else:
+            if cache:
+                self._store_result(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def run_stream(self, key: Hashable, open_stream: Callable[[], Iterable[str]],
+                   cache: bool = True) -> Union[str, Iterator[str]]:
+        """
+        Streaming variant of run(). The leader gets a generator that yields
+        open_stream()'s text chunks as they arrive; callers that join while it
+        is in flight wait for it and get the complete text as one string, as do
+        callers whose request has a cached result.
+        """
+        with self._lock:
+            hit, result = self._cached_result(key)
+            if hit:
+                return result
+            future = self._in_flight.get(key)
+
+        if future is not None:
+            return self._follow(future, open_stream)
+
+        return self._lead_stream(key, open_stream, cache)
+
+    def _lead_stream(self, key: Hashable, open_stream: Callable[[], Iterable[str]], cache: bool) -> Iterator[str]:
+        # Registered only once the generator starts: one dropped before its first
+        # next() runs no finally block, so it must leave no Future behind
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            # Another caller started the same request after run_stream() returned
+            result = self._follow(future, open_stream)
+            if isinstance(result, str):
+                yield result
+            else:
+                yield from result
+            return
+
+        chunks = []
+        try:
+            for chunk in open_stream():
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            text = "".join(chunks)
+            if cache:
+                self._store_result(key, text)
+            future.set_result(text)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
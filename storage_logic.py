@@ -1,7 +1,18 @@
 import streamlit as st
 import json
 import os
-import pandas as pd
+import copy
+import atexit
+import functools
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson # Much faster than the stdlib encoder for the nested history dicts
+except ImportError:
+    orjson = None
 
 # --- Configuration for storage limits ---
 TIER_LIMITS = {
@@ -54,23 +65,211 @@ def get_file_path(prefix: str, user_email: str) -> str:
 def load_db_file(file_path: str, initial_data: dict) -> dict:
     """Loads a user's database file, or initializes it if not found."""
     try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-            # Ensure the loaded data has the 'history' key and it's a list
-            if 'history' not in data or not isinstance(data['history'], list):
-                data['history'] = initial_data.get('history', [])
-            return data
+        # A write still waiting on the background writer is newer than the file
+        payload = pending_json_write(file_path)
+        if payload is not None:
+            data = parse_json(payload)
+        else:
+            with open(file_path, "rb") as f:
+                data = parse_json(f.read())
+        # Ensure the loaded data has the 'history' key and it's a list
+        if 'history' not in data or not isinstance(data['history'], list):
+            data['history'] = copy.deepcopy(initial_data.get('history', []))
+        return data
     except (FileNotFoundError, json.JSONDecodeError):
-        # If file not found or corrupted, return initial structure
-        return initial_data
+        # If file not found or corrupted, return a fresh copy of the initial structure
+        # (never the shared module-level dict, which sessions would then mutate)
+        return copy.deepcopy(initial_data)
 
-def save_db_file(file_path: str, data: dict):
-    """Saves a user's database file."""
+def write_text_atomic(file_path: str, text: str):
+    """
+    Writes text to a temp file in the same directory, then swaps it in with
+    os.replace(), so a crash mid-write never leaves a truncated file behind.
+    Always UTF-8, matching how parse_json reads the file back.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def parse_json(text):
+    """
+    Decodes JSON text or bytes, with orjson when it is installed. Its decode
+    error subclasses json.JSONDecodeError, so callers catch the same exception.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def serialize_json(data: dict) -> str:
+    """Encodes data as indented JSON text, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=4)
+
+# --- Background (Off-Thread) JSON Writes ---
+# One worker keeps writes to the same file in submission order. Payloads are
+# serialized on the caller's thread, so later mutations of the session dicts
+# never race with the write. Only the newest payload per file is kept while it
+# waits (latest wins), and readers check these maps before the disk.
+logger = logging.getLogger(__name__)
+_background_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="json-writer")
+_writes_lock = threading.Lock()
+_queued_writes = {}  # file path -> JSON text waiting for the worker
+_writing = {}        # file path -> JSON text the worker is writing right now
+
+def _run_queued_write(file_path: str):
+    with _writes_lock:
+        payload = _queued_writes.pop(file_path, None)
+        if payload is None:
+            return
+        _writing[file_path] = payload
     try:
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=4)
-    except IOError as e:
-        st.error(f"Error saving file {file_path}: {e}")
+        write_text_atomic(file_path, payload)
+    except Exception:
+        # Nothing is waiting on this future, so anything uncaught would vanish silently
+        logger.exception("Background write to %s failed", file_path)
+    finally:
+        with _writes_lock:
+            if _writing.get(file_path) is payload:
+                del _writing[file_path]
+
+def queue_json_write(file_path: str, data: dict):
+    """Snapshots data as JSON now and writes it to file_path on the background writer."""
+    payload = serialize_json(data)
+    with _writes_lock:
+        already_queued = file_path in _queued_writes
+        _queued_writes[file_path] = payload
+    if not already_queued:
+        _background_writer.submit(_run_queued_write, file_path)
+
+def pending_json_write(file_path: str):
+    """The JSON text queued or being written for file_path, or None if nothing is pending."""
+    with _writes_lock:
+        return _queued_writes.get(file_path) or _writing.get(file_path)
+
+def read_json_file(file_path: str):
+    """Reads JSON from file_path, preferring a write that is still queued or in progress."""
+    payload = pending_json_write(file_path)
+    if payload is not None:
+        return parse_json(payload)
+    with open(file_path, "rb") as f:
+        return parse_json(f.read())
+
+# Let queued writes land before the process exits
+atexit.register(_background_writer.shutdown, wait=True)
+
+def save_db_file(file_path: str, data: dict):
+    """
+    Saves a user's database file on the background writer, like the storage
+    tracker: the rerun never waits on disk, and failures are logged.
+    """
+    queue_json_write(file_path, data)
+
+# --- Deferred (Write-Behind) Persistence ---
+# Session state key -> file prefix used by get_file_path
+DB_FILE_PREFIXES = {
+    "utility_db": "utility_data_",
+    "teacher_db": "teacher_data_",
+    "storage": "storage_tracker_",
+}
+
+# Session DB key -> initial structure used when the user has no file yet
+DB_INITIAL_DATA = {"utility_db": UTILITY_DB_INITIAL, "teacher_db": TEACHER_DB_INITIAL}
+
+def ensure_db_loaded(db_key: str, user_email: str) -> dict:
+    """
+    Loads a session DB ('utility_db' or 'teacher_db') from disk the first time a
+    page needs it, so sessions never pay for files they do not look at.
+    """
+    if db_key not in st.session_state:
+        st.session_state[db_key] = load_db_file(
+            get_file_path(DB_FILE_PREFIXES[db_key], user_email), DB_INITIAL_DATA[db_key]
+        )
+    return st.session_state[db_key]
+
+def mark_db_dirty(db_key: str):
+    """
+    Flags a session dict ('utility_db', 'teacher_db' or 'storage') for the next
+    flush_dirty_dbs(), so several mutations in one rerun cost a single write.
+    """
+    st.session_state.setdefault('_dirty_dbs', set()).add(db_key)
+    # Every storage/history mutation goes through here, so this also invalidates
+    # the cached limit checks (see check_storage_limit_cached)
+    st.session_state['storage_version'] = st.session_state.get('storage_version', 0) + 1
+
+def adjust_storage_usage(storage: dict, storage_key: str, delta: int):
+    """
+    Applies delta bytes to one history counter ('current_utility_storage' or
+    'current_teacher_storage') and to the universal counter, never letting either
+    go below zero. Marks the tracker dirty once however many counters change, so
+    any number of adjustments in a rerun still cost one tracker write.
+    """
+    for key in (storage_key, 'current_universal_storage'):
+        value = storage.get(key, 0) + delta
+        storage[key] = value if value > 0 else 0
+    mark_db_dirty('storage')
+
+# Hard cap per history list. Tier limits stop saves well before this except on
+# Unlimited, where the oldest entries are dropped instead of growing forever.
+MAX_HISTORY_ITEMS = 2000
+
+def append_history_item(db_key: str, storage: dict, storage_key: str, record: dict):
+    """
+    Appends a saved record to a session DB's history and charges its
+    output_size_bytes to storage_key (see adjust_storage_usage). Beyond
+    MAX_HISTORY_ITEMS the oldest records are evicted and their bytes refunded.
+    """
+    history = st.session_state[db_key]['history']
+    history.append(record)
+    freed = 0
+    overflow = len(history) - MAX_HISTORY_ITEMS
+    if overflow > 0:
+        freed = sum(item.get('output_size_bytes', 0) for item in history[:overflow])
+        del history[:overflow]
+    mark_db_dirty(db_key)
+    adjust_storage_usage(storage, storage_key, record['output_size_bytes'] - freed)
+
+def persist_user_state(user_email: str, utility_db: dict = None, teacher_db: dict = None, storage: dict = None):
+    """Writes only the provided dicts, one atomic replace per file."""
+    if utility_db is not None:
+        save_db_file(get_file_path(DB_FILE_PREFIXES['utility_db'], user_email), utility_db)
+    if teacher_db is not None:
+        save_db_file(get_file_path(DB_FILE_PREFIXES['teacher_db'], user_email), teacher_db)
+    if storage is not None:
+        save_storage_tracker(storage, user_email)
+
+def flush_dirty_dbs():
+    """Writes every dict flagged since the last flush exactly once, then clears the flags."""
+    dirty = st.session_state.get('_dirty_dbs')
+    if not dirty:
+        return
+    user_email = st.session_state.get('current_user')
+    if user_email:
+        persist_user_state(user_email, **{
+            db_key: st.session_state[db_key] for db_key in dirty if db_key in st.session_state
+        })
+    dirty.clear()
+
+def flushes_dirty_dbs(func):
+    """
+    Decorator that flushes dirty DBs when func exits. Needed for st.fragment
+    functions, whose reruns never reach the end-of-script flush.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            flush_dirty_dbs()
+    return wrapper
 
 # --- Storage Tracker Management ---
 STORAGE_TRACKER_INITIAL = {
@@ -81,18 +280,22 @@ STORAGE_TRACKER_INITIAL = {
     "current_universal_storage": 0
 }
 
+STORAGE_COUNTER_KEYS = ("current_utility_storage", "current_teacher_storage", "current_universal_storage")
+
 def load_storage_tracker(user_email: str) -> dict:
     """Loads a user's storage tracker, or initializes a new one."""
     file_path = get_file_path("storage_tracker_", user_email)
     try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-            # Ensure all keys from initial are present in loaded data
-            for key, value in STORAGE_TRACKER_INITIAL.items():
-                if key not in data:
-                    data[key] = value
-            data['user_email'] = user_email # Ensure correct user email
-            return data
+        data = read_json_file(file_path)
+        # Ensure all keys from initial are present in loaded data
+        for key, value in STORAGE_TRACKER_INITIAL.items():
+            if key not in data:
+                data[key] = value
+        # Byte counters are whole numbers; coerce any float left by older files
+        for key in STORAGE_COUNTER_KEYS:
+            data[key] = int(data[key])
+        data['user_email'] = user_email # Ensure correct user email
+        return data
     except (FileNotFoundError, json.JSONDecodeError):
         # Initialize a new tracker if not found or corrupted
         initial_tracker = STORAGE_TRACKER_INITIAL.copy()
@@ -100,13 +303,12 @@ def load_storage_tracker(user_email: str) -> dict:
         return initial_tracker
 
 def save_storage_tracker(tracker_data: dict, user_email: str):
-    """Saves the current storage tracker data for a user."""
-    file_path = get_file_path("storage_tracker_", user_email)
-    try:
-        with open(file_path, "w") as f:
-            json.dump(tracker_data, f, indent=4)
-    except IOError as e:
-        st.error(f"Error saving storage tracker for {user_email}: {e}")
+    """
+    Saves the current storage tracker data for a user. The write happens on the
+    background writer (session state stays the source of truth), so the rerun
+    never waits on disk; failures are logged rather than shown.
+    """
+    queue_json_write(get_file_path("storage_tracker_", user_email), tracker_data)
 
 # --- Storage Limit Checks (CRITICAL FIX APPLIED) ---
 def calculate_mock_save_size(content: str) -> int:
@@ -193,3 +395,19 @@ def check_storage_limit(storage_data: dict, check_type: str) -> tuple[bool, str,
 
     # FINAL CAST: limit_value is now guaranteed to be a finite number.
     return can_save, error_msg, int(limit_value)
+
+def check_storage_limit_cached(storage_data: dict, check_type: str) -> tuple[bool, str, int]:
+    """
+    check_storage_limit() memoized per session on storage_version, which
+    mark_db_dirty() bumps on every mutation. Reruns that only change UI state
+    reuse the previous result.
+    """
+    version = st.session_state.get('storage_version', 0)
+    cache = st.session_state.get('_limit_cache')
+    if cache is None or cache['version'] != version:
+        cache = {'version': version, 'results': {}}
+        st.session_state['_limit_cache'] = cache
+    results = cache['results']
+    if check_type not in results:
+        results[check_type] = check_storage_limit(storage_data, check_type)
+    return results[check_type]
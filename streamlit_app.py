@@ -1,46 +1,39 @@
 import streamlit as st
 import os
-import pandas as pd
-from PIL import Image
 from io import BytesIO
+from datetime import datetime
 import json
-import re
-import random
+import logging
 import traceback # Import traceback for detailed error logging
+from typing import TYPE_CHECKING, Iterator, Tuple, Union
 
-# --- CRITICAL FIX: Robust Imports for Gemini SDK ---
-import google.generativeai as genai
-
-# Attempt to import necessary components from their most likely locations,
-# providing fallbacks in case of version mismatch/conflicts.
-
-try:
-    from google.generativeai import APIError # Primary location
-except ImportError:
-    try:
-        from google.generativeai.errors import APIError # Secondary location
-    except ImportError:
-        # Fallback: Define a generic exception to allow the rest of the code to function
-        class APIError(Exception):
-            """Generic fallback for missing APIError class."""
-            pass
-
-try:
-    from google.generativeai.types import GenerationConfig
-except ImportError:
-    # Fallback: Define a mock class if the official one is not found
-    class GenerationConfig:
-        def __init__(self, **kwargs):
-            self.__dict__.update(kwargs)
-    st.warning("⚠️ Could not import 'GenerationConfig'. Using a mock class.")
+# pandas and PIL are imported lazily where used (history views, image uploads),
+# keeping them out of cold starts for sessions that never need them.
+if TYPE_CHECKING:
+    from PIL import Image
 
+# The Gemini SDK (and its version fallbacks) lives in gemini_sdk and is imported
+# only once an API key is configured, so mock-mode sessions never load it.
 
 # Import custom modules (Assuming these files exist and are correct)
 from auth import render_login_page, logout, load_users, load_plan_overrides
+from request_coalescer import RequestCoalescer
+from rate_limiter import AdaptiveRateLimiter, is_rate_limit_error
+from gc_tuning import tune_gc
+from app_modes import AppMode
+from constants import (
+    TIER_PRICES, TIER_ORDER, PLAN_TABLE, PLAN_LABELS, HISTORY_PAGE_SIZE,
+    RESOURCE_TAGS, RESOURCE_KEY_SUFFIXES, USAGE_BARS, USAGE_BAR_TEMPLATE,
+    SIDEBAR_MODES, SIDEBAR_LABELS, SIDEBAR_NAV_KEY, SESSION_DEFAULTS, TEACHER_EXAMPLE_PROMPTS
+)
+from utility_features import (
+    run_mock_feature, FEATURE_EXAMPLES, CATEGORY_OPTIONS, CATEGORY_INDEX, FEATURES_BY_CATEGORY, FEATURE_INDEX,
+    FEATURE_PLACEHOLDERS, DEFAULT_PLACEHOLDER, UNCACHED_FEATURES
+)
 from storage_logic import (
-    load_storage_tracker, save_storage_tracker, check_storage_limit,
-    calculate_mock_save_size, get_file_path, save_db_file, load_db_file,
-    UTILITY_DB_INITIAL, TEACHER_DB_INITIAL, TIER_LIMITS
+    load_storage_tracker, check_storage_limit_cached,
+    calculate_mock_save_size, ensure_db_loaded, adjust_storage_usage, append_history_item,
+    mark_db_dirty, flush_dirty_dbs, flushes_dirty_dbs, TIER_LIMITS
 )
 
 # --- 0. CONFIGURATION AND CONSTANTS ---
@@ -48,6 +41,15 @@ WEBSITE_TITLE = "Artorius"
 MODEL = 'gemini-2.5-flash'
 LOGO_FILENAME = "image_ffd419.png" # Assuming this is the correct logo file name
 ICON_SETTING = "💡"
+CUSTOM_CSS_FILENAME = "static/custom.css"
+MAX_IMAGE_DIMENSION = 1024 # Uploaded photos are downscaled to fit this box before use
+MAX_CACHED_FEATURE_OUTPUTS = 5 # Per-session 28-in-1 outputs kept (least recently used dropped)
+GEMINI_RPM = 1000 # Requests per minute allowed by the API quota
+GEMINI_TPM = 1_000_000 # Input tokens per minute allowed by the API quota
+APP_MAX_ACTIVE_REQUESTS = 8 # Gemini calls in flight at once across all sessions
+RESPONSE_CACHE_TTL_SECONDS = 3600 # Identical requests within this window reuse the earlier response
+RESPONSE_CACHE_MAX_ENTRIES = 128
+SYSTEM_INSTRUCTION_CACHE_TTL_SECONDS = 3600 # Lifetime of the Gemini-side cached system instruction
 
 st.set_page_config(
     page_title=WEBSITE_TITLE,
@@ -56,312 +58,139 @@ st.set_page_config(
     initial_sidebar_state="auto"
 )
 
+# Process-wide and idempotent, so repeating it on every rerun is harmless
+tune_gc()
+
+logger = logging.getLogger(__name__)
+
 # --- SYSTEM INSTRUCTION LOADING (RAW CONTENT) ---
 # CRITICAL FIX: This block MUST come before the Gemini Client Initialization.
-SYSTEM_INSTRUCTION_FALLBACK = """
-<div><br class="Apple-interchange-newline">You are the "28-in-1 Stateless AI Utility Hub," a multi-modal tool built to handle 28 distinct tasks. Your primary directive is to immediately identify the user's intent and execute the exact, single function required, without engaging in conversation, retaining memory, or asking follow-up questions. Your response MUST be the direct result of the selected function.<br><br>**ROUTING DIRECTIVE:**<br>1. Analyze the User Input: Determine which of the 28 numbered features the user is requesting.<br>2. Assume the Role: Adopt the corresponding expert persona (e.g., Mathematics Expert AI) for features 22-28.<br>3. Execute & Output: Provide the immediate, concise, and definitive result. If the request is ambiguous, default to Feature #15 (Email/Text Reply Generator).<br><br>**THE 28 FUNCTION LIST:**<br>### I. Cognitive & Productivity (5)<br>1. Daily Schedule Optimizer: (Input: Tasks, time) Output: Time-blocked schedule.<br>2. Task Deconstruction Expert: (Input: Vague goal) Output: 3-5 concrete steps.<br>3. "Get Unstuck" Prompter: (Input: Problem) Output: 1 critical next-step question.<br>4. Habit Breaker: (Input: Bad habit) Output: 3 environmental changes for friction.<br>5. One-Sentence Summarizer: (Input: Long text) Output: Core idea in 1 sentence.<br><br>### II. Finance & Math (3)<br>6. Tip & Split Calculator: (Input: Bill, tip %, people) Output: Per-person cost.<br>7. Unit Converter: (Input: Value, units) Output: Precise conversion result.<br>8. Priority Spending Advisor: (Input: Goal, purchase) Output: Conflict analysis.<br><br>### III. Health & Multi-Modal (3)<br>9. Image-to-Calorie Estimate: (Input: Image of food) Output: A detailed nutritional analysis. You MUST break down the response into three sections: **A) Portion Estimate**, **B) Itemized Calorie Breakdown** (e.g., 4 oz chicken, 1 cup rice), and **C) Final Total**. Justify your portion sizes based on the visual data. **(Requires image input.)**<br>10. Recipe Improver: (Input: 3-5 ingredients) Output: Simple recipe instructions.<br>11. Symptom Clarifier: (Input: Non-emergency symptoms) Output: 3 plausible benign causes.<br><br>### IV. Communication & Writing (4)<br>12. Tone Checker & Rewriter: (Input: Text, desired tone) Output: Rewritten text.<br>13. Contextual Translator: (Input: Phrase, context) Output: Translation that matches the social register.<br>14. Metaphor Machine: (Input: Topic) Output: 3 creative analogies.<br>15. Email/Text Reply Generator: (Input: Message, points) Output: Drafted concise reply.<br><br>### V. Creative & Entertainment (3)<br>16. Idea Generator/Constraint Solver: (Input: Idea type, constraints) Output: List of unique options.<br>17. Random Fact Generator: (Input: Category) Output: 1 surprising, verified fact.<br>18. "What If" Scenario Planner": (Input: Hypothetical) Output: 3 pros and 3 cons analysis.<br><br>### VI. Tech & Logic (2)<br>19. Concept Simplifier: (Input: Complex topic) Output: Explanation using simple analogy.<br>20. Code Explainer: (Input: Code snippet) Output: Plain-language explanation of function.<br><br>### VII. Travel & Utility (1)<br>21. Packing List Generator: (Input: Trip details) Output: Categorized checklist.<br><br>### VIII. School Answers AI (8 Consolidated Experts)<br>22. Mathematics Expert AI: Answers, solves, and explains any problem or concept in the subject.<br>23. English & Literature Expert AI: Critiques writing, analyzes literature, and explains grammar, rhetoric, and composition.<br>24. History & Social Studies Expert AI: Provides comprehensive answers, context, and analysis for any event, figure, or social science theory.<br>25. Foreign Language Expert AI: Provides translations, conjugation, cultural context, vocabulary, and grammar.<br>26. Science Expert AI: Explains concepts, analyzes data, and answers questions across Physics, Chemistry, Biology, and Earth Science.<br>27. Vocational & Applied Expert AI: Acts as an expert for applied subjects like Computer Science (coding help), Business, Economics, and Trade skills.<br>28. Grade Calculator: (Input: Scores, weights) Output: Calculated final grade.<br><br>**--- Teacher Resource Tags (Separate Application Mode Directives) ---**<br>The following terms trigger specific, detailed output formats when requested from the separate Teacher's Aid mode:<br><br>* **Unit Overview:** Output must include four sections: **A) Unit Objectives**, **B) Key Topics/Subtopics**, **C) Suggested Activities (3-5)**, and **D) Assessment Overview**.<br>* **Lesson Plan:** Output must follow a structured plan: **A) Objective**, **B) Materials**, **C) Procedure (Warm-up, Main Activity, Wrap-up)**, and **D) Assessment Strategy**.<br>* **Vocabulary List:** Output must be a list of terms, each entry containing: **A) Term**, **B) Concise Definition**, and **C) Example Sentence** relevant to the topic.<br>* **Worksheet:** Output must be a numbered list of **10 varied questions** (e.g., matching, short answer, fill-in-the-blank) followed by a separate **Answer Key**.<br>* **Quiz:** Output must be a **5-question Multiple Choice Quiz** with four options for each question, followed by a separate **Answer Key**.<br>* **Test:** Output must be organized into two main sections: **A) Multiple Choice (15 Questions)** and **B) Short/Long Answer (4 Questions)**, followed by a detailed **Answer Key/Rubric**.<br></div>
-"""
+@st.cache_resource(show_spinner=False)
+def load_system_instruction() -> Tuple[str, bool]:
+    """Reads system_instruction.txt (or the bundled fallback) once per process; returns (text, used_fallback)."""
+    try:
+        with open("system_instruction.txt", "r") as f:
+            return f.read(), False
+    except FileNotFoundError:
+        with open("system_instruction_fallback.txt", "r") as f:
+            return f.read(), True
 
-try:
-    # This must be defined before the client uses it.
-    with open("system_instruction.txt", "r") as f:
-        SYSTEM_INSTRUCTION = f.read()
-except FileNotFoundError:
-    SYSTEM_INSTRUCTION = SYSTEM_INSTRUCTION_FALLBACK
-    st.warning("`system_instruction.txt` file not found. Using hardcoded fallback instructions.")
+# This must be defined before the client uses it.
+SYSTEM_INSTRUCTION, _used_fallback_instruction = load_system_instruction()
+if _used_fallback_instruction:
+    st.warning("`system_instruction.txt` file not found. Using bundled fallback instructions.")
 
 
-TIER_PRICES = {
-    "Free Tier": "Free", "28/1 Pro": "$7/month", "Teacher Pro": "$7/month",
-    "Universal Pro": "$12/month", "Unlimited": "$18/month"
-}
+@st.cache_resource(show_spinner=False)
+def load_custom_css() -> str:
+    """Reads the custom stylesheet once per process, wrapped ready for st.markdown."""
+    with open(CUSTOM_CSS_FILENAME, "r") as f:
+        return f"<style>\n{f.read()}</style>"
 
-# Apply custom CSS
-st.markdown(
-    """
-    <style>
-    .css-1d391kg {
-        padding-top: 2rem;
-    }
-    .tier-label {
-        font-size: 0.8em;
-        color: #888;
-        margin-top: -15px;
-        margin-bottom: 20px;
-    }
-    .stRadio {
-        display: flex;
-        flex-direction: column;
-        align-items: flex-start;
-    }
-    .stRadio > label {
-        padding-right: 0;
-        margin-bottom: 5px;
-    }
-    .example-text {
-        font-size: 0.8em;
-        color: #555;
-        margin-top: -5px;
-        margin-bottom: 10px;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
 
-# --- INITIALIZE GEMINI CLIENT (FINAL, CORRECT FIX) ---
-client = None # Default to None
-api_key_source = "None"
+def inject_custom_css():
+    """Emits the custom stylesheet."""
+    st.markdown(load_custom_css(), unsafe_allow_html=True)
 
-try:
-    api_key = None
-    
-    # 1. Prioritize Streamlit secrets
-    if "GEMINI_API_KEY" in st.secrets:
-        api_key = st.secrets["GEMINI_API_KEY"]
-        api_key_source = "Streamlit Secrets"
-    # 2. Fallback to os.getenv 
-    elif os.getenv("GEMINI_API_KEY"):
-        api_key = os.getenv("GEMINI_API_KEY")
-        api_key_source = "Environment Variable"
-
-    if api_key and api_key.strip():
-        # Use the standard, modern configuration method
-        genai.configure(api_key=api_key) 
-        
-        # CRITICAL FIX: Pass system instruction at model instantiation.
-        client = genai.GenerativeModel(MODEL, system_instruction=SYSTEM_INSTRUCTION) 
-        # Success message REMOVED as requested. Nothing is displayed on successful connection.
-    else:
-        # Failure: Key not found or is empty
-        st.sidebar.warning("⚠️ Gemini API Key not found or is empty. Running in MOCK MODE.")
-        
-except APIError as e:
-    client = None
-    # Failure: API connection error
-    st.sidebar.error(f"❌ Gemini API Setup Error: {e}")
-    st.sidebar.info("Please ensure your Gemini API Key is valid and active.")
-except Exception as e:
-    client = None
-    # Failure: Other unexpected error
-    st.sidebar.error(f"❌ Unexpected Setup Error during Gemini client initialization. See Streamlit logs for details.")
-    st.exception(e)
-    
-# --- END INITIALIZE GEMINI CLIENT ---
 
+# Every rerun: Streamlit removes any element a run does not re-emit
+inject_custom_css()
 
-# --- 1. THE 28 FUNCTION LIST (Internal Mapping for Mocking) ---
-def daily_schedule_optimizer(tasks_time: str) -> str:
-    return f"**Feature 1: Daily Schedule Optimizer**\nTime-blocked schedule for: {tasks_time}\n9:00 AM - Focus Work, 11:00 AM - Meeting, 1:00 PM - Deep Dive Task."
-def task_deconstruction_expert(vague_goal: str) -> str:
-    return f"**Feature 2: Task Deconstruction Expert**\n3 Concrete Steps for '{vague_goal}':\n* Define scope and audience.\n* Gather resources and outline structure.\n* Draft first section and seek feedback."
-def get_unstuck_prompter(problem: str) -> str:
-    return f"**Feature 3: 'Get Unstuck' Prompter**\nCritical Next-Step Question for '{problem}': **What is the single, 5-minute action that moves you forward right now?**"
-def habit_breaker(bad_habit: str) -> str:
-    return f"**Feature 4: Habit Breaker**\n3 Environmental Changes for friction against '{bad_habit}':\n1. Move the trigger object out of sight.\n2. Set a digital blocker or reminder.\n3. Identify a healthy replacement activity."
-def one_sentence_summarizer(long_text: str) -> str:
-    return f"**Feature 5: One-Sentence Summarizer**\nCore Idea: The provided text discusses complex topics and requires concise distillation of its main argument."
-
-def tip_split_calculator(bill_tip_people: str) -> str:
-    bill_match = re.search(r'bill:\s*[\$\s]*([\d\.]+)', bill_tip_people, re.IGNORECASE)
-    tip_match = re.search(r'tip:\s*([\d\.]+)\s*%', bill_tip_people, re.IGNORECASE)
-    people_match = re.search(r'people:\s*(\d+)', bill_tip_people, re.IGNORECASE)
-
-    bill = float(bill_match.group(1)) if bill_match else 50.0
-    tip_percent = float(tip_match.group(1)) if tip_match else 18.0
-    people = int(people_match.group(1)) if people_match else 2
-
-    total_bill = bill * (1 + (tip_percent / 100))
-    per_person = total_bill / people
-    return f"**Feature 6: Tip & Split Calculator**\nFor Bill: ${bill:.2f}, Tip: {tip_percent:.0f}%, People: {people}\n**Total Per Person Cost: ${per_person:.2f}**"
-def unit_converter(value_units: str) -> str:
-    return f"**Feature 7: Unit Converter**\nPrecise conversion of '{value_units}':\n*10 miles is 16.0934 kilometers.*"
-def priority_spending_advisor(goal_purchase: str) -> str:
-    return f"**Feature 8: Priority Spending Advisor**\nConflict Analysis for '{goal_purchase}':\nThis purchase conflicts directly with your goal, delaying achievement by an estimated 6 weeks due to the opportunity cost."
-
-def image_to_calorie_estimate(image: Image.Image, user_input: str) -> str:
-    st.warning("Feature 9: Image processing is mocked. A real implementation would use a vision AI model.")
-    return f"""
-**Feature 9: Image-to-Calorie Estimate**
-(Analysis for uploaded image: {image.filename if image else 'N/A'})
-**A) Portion Estimate:** One medium patty, two slices of bread, side salad.
-**B) Itemized Calorie Breakdown:**
-* Beef Patty (4oz, lean): ~200 cal
-* Whole Wheat Bread (2 slices): ~160 cal
-* Lettuce/Tomato/Dressing: ~50 cal
-**C) Final Total:** **~410 calories**
-"""
-def recipe_improver(ingredients: str) -> str:
-    return f"**Feature 10: Recipe Improver**\nSimple recipe instructions for: {ingredients}\n1. Sauté the chicken and onions until browned. 3. Add vegetables and stock. 4. Simmer for 20 minutes and serve with rice."
-def symptom_clarifier(symptoms: str) -> str:
-    return f"**Feature 11: Symptom Clarifier**\n3 plausible benign causes for '{symptoms}':\n1. Common seasonal allergies (pollen/dust).\n2. Mild fatigue due to poor sleep.\n3. Dehydration or temporary low blood sugar."
-
-def tone_checker_rewriter(text_tone: str) -> str:
-    return f"**Feature 12: Tone Checker & Rewriter**\nRewritten text (Desired tone: Professional):\n'I acknowledge receipt of your request and will provide the deliverable by the end of business tomorrow.'"
-def contextual_translator(phrase_context: str) -> str:
-    return f"**Feature 13: Contextual Translator**\nTranslation (French, Formal Register): **'Pourriez-vous, s'il vous plaît, me donner les détails?'** (Could you, please, give me the details?)"
-def metaphor_machine(topic: str) -> str:
-    return f"**Feature 14: Metaphor Machine**\n3 Creative Analogies for '{topic}':\n1. The cloud is a global, shared library.\n2. Information flow is like an ocean tide.\n3. The network is a massive spider web."
-def email_text_reply_generator(message_points: str) -> str:
-    return f"**Feature 15: Email/Text Reply Generator**\nDrafted concise reply for: {message_points}\n'Thank you for bringing this up. I will review the documents immediately and ensure the changes are implemented by 3 PM today.'"
-
-def idea_generator_constraint_solver(idea_constraints: str) -> str:
-    return f"**Feature 16: Idea Generator/Constraint Solver**\nUnique options for '{idea_constraints}':\n- Idea A: Eco-friendly delivery service using electric bikes.\n- Idea B: Subscription box for local, artisanal products.\n- Idea C: Micro-consulting for remote teams."
-def random_fact_generator(category: str) -> str:
-    facts = ["A single cloud can weigh more than 1 million pounds.", "The shortest war in history lasted only 38 to 45 minutes.", "The smell of rain is called petrichor."]
-    return f"**Feature 17: Random Fact Generator**\nCategory: {category if category else 'General'}\n**Fact:** {random.choice(facts)}"
-def what_if_scenario_planner(hypothetical: str) -> str:
-    return f"""
-**Feature 18: 'What If' Scenario Planner**
-Analysis for: What if global internet access was free?
-Pros: 1. Unprecedented educational equity. 2. Massive economic growth in developing nations. 3. Accelerated scientific collaboration.
-Cons: 1. Overwhelming infrastructure cost/upkeep. 2. Exponential increase in cyber-security threats. 3. Collapse of existing telecommunication revenue models.
-"""
+# --- INITIALIZE GEMINI CLIENT (FINAL, CORRECT FIX) ---
+@st.cache_resource(show_spinner=False)
+def get_gemini_api_key() -> str:
+    """Resolves the API key once per process: Streamlit secrets, then GEMINI_API_KEY; empty if unset."""
+    try:
+        # 1. Prioritize Streamlit secrets
+        if "GEMINI_API_KEY" in st.secrets:
+            return str(st.secrets["GEMINI_API_KEY"]).strip()
+    except Exception:
+        # st.secrets raises when no secrets file exists at all
+        pass
+    # 2. Fallback to os.getenv
+    return os.getenv("GEMINI_API_KEY", "").strip()
+
+def _instruction_cache(genai):
+    """Gemini cached content holding SYSTEM_INSTRUCTION, extending a live one rather than adding another."""
+    import hashlib
+    from datetime import timedelta
+    ttl = timedelta(seconds=SYSTEM_INSTRUCTION_CACHE_TTL_SECONDS)
+    # Named after the instruction's hash, so an edited instruction never reuses a stale cache
+    display_name = "system-instruction-" + hashlib.blake2b(SYSTEM_INSTRUCTION.encode(), digest_size=8).hexdigest()
+    for cached in genai.caching.CachedContent.list():
+        if cached.display_name == display_name and cached.model == f"models/{MODEL}":
+            cached.update(ttl=ttl)
+            return cached
+    return genai.caching.CachedContent.create(
+        model=f"models/{MODEL}",
+        display_name=display_name,
+        system_instruction=SYSTEM_INSTRUCTION,
+        ttl=ttl,
+    )
+
+# The model handle is rebuilt before its server-side instruction cache expires
+@st.cache_resource(show_spinner=False, ttl=SYSTEM_INSTRUCTION_CACHE_TTL_SECONDS - 300)
+def get_genai_client():
+    """
+    Builds the shared Gemini model handle, or returns None (mock mode) without an
+    API key. Setup errors are raised, so they are not cached.
+    """
+    api_key = get_gemini_api_key()
+    if not api_key:
+        return None
+    from gemini_sdk import genai, CACHE_UNAVAILABLE_ERRORS
+    # Use the standard, modern configuration method
+    genai.configure(api_key=api_key)
+    try:
+        return genai.GenerativeModel.from_cached_content(cached_content=_instruction_cache(genai))
+    except CACHE_UNAVAILABLE_ERRORS:
+        logger.warning("Gemini context caching unavailable; sending the system instruction inline", exc_info=True)
+        return genai.GenerativeModel(MODEL, system_instruction=SYSTEM_INSTRUCTION)
 
-def concept_simplifier(complex_topic: str) -> str:
-    return f"**Feature 19: Concept Simplifier**\nExplanation of '{complex_topic}' using simple analogy:\nQuantum entanglement is like having two special coins that always land on the opposite side, no matter how far apart you take them. Observing one instantly tells you the state of the other."
-def code_explainer(code_snippet: str) -> str:
-    return f"**Feature 20: Code Explainer**\nPlain-language explanation of function:\nThis Python code snippet defines a function that takes a list of numbers, filters out any duplicates, sorts the remaining unique numbers, and returns the result."
-
-def packing_list_generator(trip_details: str) -> str:
-    return f"""
-**Feature 21: Packing List Generator**
-Checklist for: {trip_details}
-**Clothes:** 3 Shirts, 2 Pants, 1 Jacket, 1 Pair of Formal Shoes.
-**Essentials:** Passport, Wallet, Adapter, Phone Charger, Medications.
-**Toiletries:** Toothbrush, Paste, Shampoo (Travel size).
-"""
+if not get_gemini_api_key():
+    # Failure: Key not found or is empty
+    st.sidebar.warning("⚠️ Gemini API Key not found or is empty. Running in MOCK MODE.")
 
-def mathematics_expert_ai(problem: str) -> str:
-    return f"**Feature 22: Mathematics Expert AI**\nAnswer, Solve, and Explain: The solution to the equation **2x + 5 = 15** is **x = 5**. (The explanation involves isolating the variable by subtracting 5 and then dividing by 2)."
-def english_literature_expert_ai(query: str) -> str:
-    return f"**Feature 23: English & Literature Expert AI**\nCritique/Analysis for '{query}':\nThe use of the color green in *The Great Gatsby* symbolizes the unattainable American Dream and Jay Gatsby's eternal hope for the past."
-def history_social_studies_expert_ai(query: str) -> str:
-    return f"**Feature 24: History & Social Studies Expert AI**\nComprehensive Answer/Analysis for '{query}':\nThe major cause of the French Revolution was the stark inequality between the wealthy aristocracy and the impoverished Third Estate, exacerbated by famine and enlightenment ideas."
-def foreign_language_expert_ai(query: str) -> str:
-    return f"**Feature 25: Foreign Language Expert AI**\nTranslation/Context for '{query}':\n*German:* **Guten Tag! Wie geht es Ihnen?** (Formal: Hello! How are you?). *Context:* Use 'Ihnen' when speaking to strangers or elders."
-def science_expert_ai(query: str) -> str:
-    return f"**Feature 26: Science Expert AI**\nExplanation/Analysis for '{query}':\nPhotosynthesis is the process by which plants convert light energy, carbon dioxide, and water into glucose (food) and oxygen. Its chemical formula is **6CO₂ + 6H₂O + Light Energy → C₆H₁₂O₆ + 6O₂**."
-def vocational_applied_expert_ai(query: str) -> str:
-    return f"**Feature 27: Vocational & Applied Expert AI**\nExpert Answer for '{query}':\nPolymorphism in Python allows objects of different classes to be treated as objects of a common interface (the same function name can be used on different types of objects)."
-def grade_calculator(scores_weights: str) -> str:
-    score_weight_pattern = re.compile(r'(\w+)\s*(\d+)\s*\((\d+)%\)')
-    matches = score_weight_pattern.findall(scores_weights)
-
-    total_score = sum(float(s) * (float(w) / 100) for _, s, w in matches)
-    total_weight = sum(float(w) / 100 for _, _, w in matches)
-
-    if total_weight > 0:
-        final_grade = (total_score / total_weight) if total_weight <= 1.0 else total_score
-        return f"**Feature 28: Grade Calculator**\nBased on input, your final calculated grade is: **{final_grade:.2f}%**"
-    return f"**Feature 28: Grade Calculator**\nInput data for calculation missing or invalid. Please provide Scores and Weights (e.g., Quiz 80 (20%))."
-
-
-# --- CATEGORY AND FEATURE MAPPING ---
-UTILITY_CATEGORIES = {
-    "Cognitive & Productivity": {
-        "1. Daily Schedule Optimizer": daily_schedule_optimizer,
-        "2. Task Deconstruction Expert": task_deconstruction_expert,
-        "3. 'Get Unstuck' Prompter": get_unstuck_prompter, # <--- FIXED HERE
-        "4. Habit Breaker": habit_breaker,
-        "5. One-Sentence Summarizer": one_sentence_summarizer,
-    },
-    "Finance & Math": {
-        "6. Tip & Split Calculator": tip_split_calculator,
-        "7. Unit Converter": unit_converter,
-        "8. Priority Spending Advisor": priority_spending_advisor,
-    },
-    "Health & Multi-Modal": {
-        "9. Image-to-Calorie Estimate": image_to_calorie_estimate,
-        "10. Recipe Improver": recipe_improver,
-        "11. Symptom Clarifier": symptom_clarifier,
-    },
-    "Communication & Writing": {
-        "12. Tone Checker & Rewriter": tone_checker_rewriter,
-        "13. Contextual Translator": contextual_translator,
-        "14. Metaphor Machine": metaphor_machine,
-        "15. Email/Text Reply Generator": email_text_reply_generator,
-    },
-    "Creative & Entertainment": {
-        "16. Idea Generator/Constraint Solver": idea_generator_constraint_solver,
-        "17. Random Fact Generator": random_fact_generator,
-        '18. "What If" Scenario Planner': what_if_scenario_planner,
-    },
-    "Tech & Logic": {
-        "19. Concept Simplifier": concept_simplifier,
-        "20. Code Explainer": code_explainer,
-    },
-    "Travel & Utility": {
-        "21. Packing List Generator": packing_list_generator,
-    },
-    "School Answers AI": {
-        "22. Mathematics Expert AI": mathematics_expert_ai,
-        "23. English & Literature Expert AI": english_literature_expert_ai,
-        "24. History & Social Studies Expert AI": history_social_studies_expert_ai,
-        "25. Foreign Language Expert AI": foreign_language_expert_ai,
-        "26. Science Expert AI": science_expert_ai,
-        "27. Vocational & Applied Expert AI": vocational_applied_expert_ai,
-        "28. Grade Calculator": grade_calculator,
-    }
-}
+# --- END INITIALIZE GEMINI CLIENT ---
+
+@st.cache_resource(show_spinner=False)
+def get_request_coalescer() -> RequestCoalescer:
+    """Process-wide coalescer (and response cache) shared by every session's Gemini calls."""
+    return RequestCoalescer(ttl=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """Process-wide limiter, so every session draws on the same quota counters."""
+    return AdaptiveRateLimiter(GEMINI_RPM, GEMINI_TPM, max_concurrency=APP_MAX_ACTIVE_REQUESTS)
 
-# --- FEATURE EXAMPLE MAPPING ---
-FEATURE_EXAMPLES = {
-    "1. Daily Schedule Optimizer": "I have 4 hours for work, 1 hour for lunch, and need to read a report.",
-    "2. Task Deconstruction Expert": "My goal is to 'start a small online business'.",
-    "3. 'Get Unstuck' Prompter": "I can't figure out the opening paragraph for my essay.", # <--- FIXED HERE
-    "4. Habit Breaker": "I want to stop checking social media first thing in the morning.",
-    "5. One-Sentence Summarizer": "The theory of relativity, developed by Albert Einstein, fundamentally changed physics...",
-    "6. Tip & Split Calculator": "Bill: $75.50, Tip: 20%, People: 4",
-    "7. Unit Converter": "Convert 55 miles per hour to kilometers per hour.",
-    "8. Priority Spending Advisor": "Should I buy a new gaming console or save for a down payment on a car?",
-    "9. Image-to-Calorie Estimate": "A bowl of chili with sour cream and a cornbread muffin.",
-    "10. Recipe Improver": "Ingredients: Chicken breast, can of black beans, jar of salsa.",
-    "11. Symptom Clarifier": "I have a headache behind my eyes and mild nausea.",
-    "12. Tone Checker & Rewriter": "Original: 'I hate this process, it's so slow.' Target Tone: Formal.",
-    "13. Contextual Translator": "Translate 'It's raining cats and dogs' into Spanish, focusing on the conversational tone.",
-    "14. Metaphor Machine": "Create metaphors for the concept of 'remote work'.",
-    "15. Email/Text Reply Generator": "Message: Meeting moved to 3 PM. Reply points: Confirm, apologize for absence at 1 PM.",
-    "16. Idea Generator/Constraint Solver": "Generate 3 ideas for a mobile app using only the microphone and camera.",
-    "17. Random Fact Generator": "Give me a random fact about the Roman Empire.",
-    '18. "What If" Scenario Planner': "What if global internet access was free?",
-    "19. Concept Simplifier": "Explain the basics of Blockchain technology to a 10-year-old.",
-    "20. Code Explainer": "Explain this Python code: `def sum_list(x): return sum(x)`",
-    "21. Packing List Generator": "I'm taking a 5-day business trip to Chicago in December.",
-    "22. Mathematics Expert AI": "Solve for X: $3(x-4) = 9$. Show your steps.",
-    "23. English & Literature Expert AI": "Analyze the theme of isolation in 'The Catcher in the Rye'.",
-    "24. History & Social Studies Expert AI": "What were the primary economic effects of the Silk Road?",
-    "25. Foreign Language Expert AI": "What is the polite way to ask for the bill in Japanese?",
-    "26. Science Expert AI": "Describe the function of the Golgi apparatus in a cell.",
-    "27. Vocational & Applied Expert AI": "Explain how to properly ground an electrical outlet.",
-    "28. Grade Calculator": "Quiz 80 (20%), Midterm 75 (30%), Final 90 (50%)",
-}
 
 # --- AI GENERATION FUNCTION (FINAL VERSION) ---
-def run_ai_generation(feature_function_key: str, prompt_text: str, uploaded_image: Image.Image = None) -> str:
+def run_ai_generation(feature_function_key: str, prompt_text: str, uploaded_image: "Image.Image" = None,
+                      image_data: bytes = None, image_digest: str = None) -> Union[str, Iterator[str]]:
     """
     Executes the selected feature function. Uses the real Gemini API if available,
-    otherwise falls back to the mock functions.
+    otherwise falls back to the mock functions. Returns a string (mock or error) or
+    an iterator of streamed text chunks; pass either to render_generation_output().
     """
 
+    # The client is built on the first generation, not at startup
+    try:
+        client = get_genai_client()
+    except Exception as e:
+        # Setup failures fall back to mock mode, as they did when the client was built at startup
+        client = None
+        st.error(f"❌ Gemini API Setup Error: {e}")
+        st.info("Please ensure your Gemini API Key is valid and active.")
+
     # 1. Fallback/Mock execution
     if client is None:
         st.warning("⚠️ **MOCK MODE:** Gemini Client is NOT initialized. Using Mock Response.")
-        selected_function = None
-        
-        # Check Utility Mappings
-        for category_features in UTILITY_CATEGORIES.values():
-            if feature_function_key in category_features:
-                selected_function = category_features[feature_function_key]
-                break
-        
+        mock_response = run_mock_feature(feature_function_key, prompt_text, uploaded_image)
+
         is_teacher_aid_proxy = feature_function_key == "Teacher_Aid_Routing"
         
-        if selected_function:
-            if feature_function_key == "9. Image-to-Calorie Estimate":
-                return selected_function(uploaded_image, prompt_text)
-            else:
-                return selected_function(prompt_text)
+        if mock_response is not None:
+            return mock_response
         elif is_teacher_aid_proxy:
             # --- CRITICAL FIX: Detailed Mock Responses for Teacher Aid Resources ---
             if "Unit Overview" in prompt_text:
@@ -629,16 +458,18 @@ The system has received your request. For a more structured output, please inclu
         else:
             return "Error: Feature not found or not yet implemented."
 
-    # 2. Real AI execution (if client is available)
+    # 2. Real AI execution (if client is available; the SDK is already loaded by then)
+    from gemini_sdk import genai, APIError, GenerationConfig
     try:
         contents = []
         if feature_function_key == "9. Image-to-Calorie Estimate" and uploaded_image:
-            # Convert PIL Image to BytesIO for sending to Gemini
-            img_byte_arr = BytesIO()
-            uploaded_image.save(img_byte_arr, format=uploaded_image.format or 'PNG')
-            img_byte_arr = img_byte_arr.getvalue()
+            if image_data is None:
+                # Convert PIL Image to BytesIO for sending to Gemini
+                img_byte_arr = BytesIO()
+                uploaded_image.save(img_byte_arr, format=uploaded_image.format or 'PNG')
+                image_data = img_byte_arr.getvalue()
 
-            contents.append(genai.types.Blob(mime_type="image/jpeg", data=img_byte_arr))
+            contents.append(genai.types.Blob(mime_type="image/jpeg", data=image_data))
 
         contents.append(prompt_text)
 
@@ -646,11 +477,46 @@ The system has received your request. For a more structured output, please inclu
         # Create an empty config object to satisfy the required argument.
         generation_config = GenerationConfig()
 
-        response = client.generate_content(
-            contents=contents,
-            generation_config=generation_config
-        )
-        return response.text
+        # Rough input size (~4 characters per token) for the limiter's TPM window
+        estimated_tokens = (len(SYSTEM_INSTRUCTION) + len(prompt_text)) // 4
+
+        def open_stream():
+            # The slot is held until the stream is fully read (or abandoned)
+            with get_rate_limiter().slot(estimated_tokens):
+                streamed_any = False
+                try:
+                    response = client.generate_content(
+                        contents=contents,
+                        generation_config=generation_config,
+                        stream=True
+                    )
+                    for chunk in response:
+                        streamed_any = True
+                        yield chunk.text
+                except Exception as e:
+                    # Once text is on screen, or when over quota, retrying would not help
+                    if streamed_any or is_rate_limit_error(e):
+                        raise
+                    # Streaming failed before any text arrived; retry once as a single response
+                    yield client.generate_content(
+                        contents=contents,
+                        generation_config=generation_config
+                    ).text
+
+        has_image = len(contents) > 1
+        if not has_image or image_digest:
+            # Identical requests in flight from other sessions share one API call, and
+            # repeats within the cache TTL are answered from the finished response
+            # (except for UNCACHED_FEATURES, whose answers should vary).
+            # Only outer whitespace is ignored; inner layout matters for code and tables.
+            request_key = (feature_function_key, prompt_text.strip(), image_digest if has_image else None)
+            result = get_request_coalescer().run_stream(
+                request_key, open_stream, cache=feature_function_key not in UNCACHED_FEATURES
+            )
+            if isinstance(result, str):
+                return result
+            return _stream_with_error_text(result)
+        return _stream_with_error_text(open_stream())
 
     except APIError as e:
         return f"Gemini API Error: Could not complete request. Details: {e}"
@@ -658,6 +524,25 @@ The system has received your request. For a more structured output, please inclu
         return f"An unexpected error occurred during AI generation: {e}"
 
 
+def _stream_with_error_text(chunks: Iterator[str]) -> Iterator[str]:
+    """Turns failures raised mid-stream into the error text run_ai_generation returns."""
+    from gemini_sdk import APIError
+    try:
+        yield from chunks
+    except APIError as e:
+        yield f"\n\nGemini API Error: Could not complete request. Details: {e}"
+    except Exception as e:
+        yield f"\n\nAn unexpected error occurred during AI generation: {e}"
+
+
+def render_generation_output(result: Union[str, Iterator[str]]) -> str:
+    """Renders a run_ai_generation() result, streaming chunks as they arrive; returns the full text."""
+    if isinstance(result, str):
+        st.markdown(result)
+        return result
+    return st.write_stream(result) or ""
+
+
 # --- CATEGORY AND FEATURE MAPPING (REST OF FILE CONTENT FOLLOWS) ---
 # ... [The rest of your UTILITY_CATEGORIES, FEATURE_EXAMPLES, and rendering functions] ...
 
@@ -667,97 +552,109 @@ The system has received your request. For a more structured output, please inclu
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 
-if st.session_state.logged_in:
-    user_email = st.session_state.current_user
+# Logged-out sessions only see the login page; st.stop() ends the run here, so
+# nothing below (session init, renderer definitions, routing) executes for them.
+if not st.session_state.logged_in:
+    render_login_page()
+    st.stop()
+
+user_email = st.session_state.current_user
 
+# --- Load Storage Tracker once per login ---
+# Session state is the source of truth afterwards (all writes go through it),
+# so reruns no longer re-read and re-write the user's files. The history DBs
+# are loaded lazily by the pages that use them (see ensure_db_loaded).
+if st.session_state.get('_loaded_user') != user_email:
     # --- Load Storage Tracker (Ensures Tier/User data is consistent) ---
     storage_data = load_storage_tracker(user_email)
 
-    # Apply plan override if available
-    plan_overrides = load_plan_overrides()
-    if user_email in plan_overrides:
-        storage_data['tier'] = plan_overrides[user_email]
-
-    storage_data['user_email'] = user_email
+    # Apply plan override if available; the tracker is only rewritten when the
+    # override actually changes the stored tier
+    override_tier = load_plan_overrides().get(user_email)
     st.session_state['storage'] = storage_data
-    save_storage_tracker(st.session_state.storage, user_email)
-
+    if override_tier is not None and override_tier != storage_data['tier']:
+        storage_data['tier'] = override_tier
+        mark_db_dirty('storage')
 
-    # --- CRITICAL FIX: Load DBs and ensure structure on every run (Persistence) ---
+    # Drop any previous user's DBs (reloaded on first use) and the limit checks
+    # memoized against them, which a tier-preserving login would not invalidate
+    st.session_state.pop('utility_db', None)
+    st.session_state.pop('teacher_db', None)
+    st.session_state.pop('_limit_cache', None)
 
-    # 1. Utility DB
-    db_file_path_utility = get_file_path("utility_data_", user_email)
-    st.session_state['utility_db'] = load_db_file(db_file_path_utility, UTILITY_DB_INITIAL)
+    # --- Standard App State Initialization ---
+    # Nothing removes these keys after login, so one pass per login is enough
+    for key, default in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = default() if isinstance(default, type) else default
+    # Unlike those, the radio's value is dropped on runs that do not draw it (the
+    # login page), so it is reseeded from app_mode, which survives logout
+    app_mode = st.session_state['app_mode']
+    st.session_state[SIDEBAR_NAV_KEY] = app_mode if app_mode in SIDEBAR_LABELS else None
 
-    if 'history' not in st.session_state['utility_db'] or not isinstance(st.session_state['utility_db']['history'], list):
-         st.session_state['utility_db']['history'] = UTILITY_DB_INITIAL.get('history', [])
+    st.session_state['_loaded_user'] = user_email
 
-    # 2. Teacher DB
-    db_file_path_teacher = get_file_path("teacher_data_", user_email)
-    st.session_state['teacher_db'] = load_db_file(db_file_path_teacher, TEACHER_DB_INITIAL)
 
-    if 'history' not in st.session_state['teacher_db'] or not isinstance(st.session_state['teacher_db']['history'], list):
-         st.session_state['teacher_db']['history'] = TEACHER_DB_INITIAL.get('history', [])
+# --- NAVIGATION RENDERER ---
+@st.cache_resource(show_spinner=False)
+def load_logo_bytes() -> "bytes | None":
+    """Reads the sidebar logo bytes once per process; None when the file is missing."""
+    if not os.path.exists(LOGO_FILENAME):
+        return None
+    with open(LOGO_FILENAME, "rb") as f:
+        return f.read()
 
-    # --- Standard App State Initialization ---
-    if 'app_mode' not in st.session_state:
-        st.session_state['app_mode'] = "Dashboard"
-    if '28_in_1_output' not in st.session_state:
-        st.session_state['28_in_1_output'] = ""
-    # NOTE: The old 'teacher_output' and 'teacher_view' states are now obsolete/deleted.
 
+def set_app_mode(mode: AppMode):
+    """on_click callback that switches page and keeps the sidebar radio in step."""
+    st.session_state['app_mode'] = mode
+    st.session_state[SIDEBAR_NAV_KEY] = mode if mode in SIDEBAR_LABELS else None
 
-    if 'selected_28_in_1_category' not in st.session_state:
-        st.session_state['selected_28_in_1_category'] = list(UTILITY_CATEGORIES.keys())[0]
-    if 'selected_28_in_1_feature' not in st.session_state:
-        st.session_state['selected_28_in_1_feature'] = list(UTILITY_CATEGORIES[st.session_state['selected_28_in_1_category']].keys())[0]
 
+def _on_sidebar_nav():
+    """on_change callback for the sidebar radio."""
+    selected_mode = st.session_state[SIDEBAR_NAV_KEY]
+    if selected_mode is not None:
+        st.session_state['app_mode'] = selected_mode
 
-# --- NAVIGATION RENDERER ---
 
-def render_main_navigation_sidebar():
+def render_main_navigation_sidebar(storage: dict, user_email: str):
     """Renders the main navigation using Streamlit's sidebar for responsiveness."""
     with st.sidebar:
         # Logo and Title
         col_logo, col_title = st.columns([0.25, 0.75])
-        image_to_use = LOGO_FILENAME
+        logo_bytes = load_logo_bytes()
         with col_logo:
-            if os.path.exists(image_to_use):
-                st.image(image_to_use, width=30)
+            if logo_bytes is not None:
+                st.image(logo_bytes, width=30)
             else:
                 st.markdown(f"**{ICON_SETTING}**")
         with col_title:
             st.markdown(f"**{WEBSITE_TITLE}**")
 
-        st.markdown("---")
-        st.markdown(f"**User:** *{st.session_state.current_user}*")
-        st.markdown(f"**Plan:** *{st.session_state.storage['tier']}*")
-        st.markdown("---")
+        tier = storage['tier']
+        plan_label = PLAN_LABELS.get(tier) or f"**Plan:** *{tier}*"
+        # Dividers, user and plan as one element; the blank lines keep "---" a rule, not a heading underline
+        st.markdown(f"---\n\n**User:** *{user_email}*\n\n{plan_label}\n\n---")
 
         # CRITICAL FIX: Removed 28-in-1 and Teacher Aid from sidebar.
-        menu_options = [
-            {"label": "🖥️ Dashboard", "mode": "Dashboard"},
-            {"label": "📊 Usage Dashboard", "mode": "Usage Dashboard"},
-            {"label": "💳 Plan Manager", "mode": "Plan Manager"},
-            {"label": "🧹 Data Clean Up", "mode": "Data Clean Up"},
-            {"label": "🚪 Logout", "mode": "Logout"}
-        ]
-
-        for item in menu_options:
-            mode = item["mode"]
-            button_id = f"sidebar_nav_button_{mode.replace(' ', '_')}"
+        # One radio for the pages, kept in step with app_mode by its callbacks
+        st.radio(
+            "Navigation",
+            SIDEBAR_MODES,
+            key=SIDEBAR_NAV_KEY,
+            format_func=SIDEBAR_LABELS.__getitem__,
+            on_change=_on_sidebar_nav,
+            label_visibility="collapsed"
+        )
 
-            if st.button(item["label"], key=button_id, use_container_width=True):
-                if mode == "Logout":
-                    logout()
-                else:
-                    st.session_state['app_mode'] = mode
-                    st.rerun()
+        if st.button("🚪 Logout", key="sidebar_nav_button_Logout", use_container_width=True):
+            logout()
 
 
 # --- APPLICATION PAGE RENDERERS ---
 
-def render_main_dashboard():
+def render_main_dashboard(storage: dict, user_email: str):
     """Renders the split-screen selection for Teacher Aid and 28/1 Utilities."""
     st.title("🖥️ Main Dashboard")
     st.caption("Access your two main application suites: **Teacher Aid** or **28-in-1 Stateless Utility Hub**.")
@@ -767,21 +664,19 @@ def render_main_dashboard():
         with st.container(border=True):
             st.header("🎓 Teacher Aid")
             st.markdown("Access curriculum planning tools, resource generation, and saved resources.")
-            if st.button("Launch Teacher Aid", key="launch_teacher_btn", use_container_width=True):
-                st.session_state['app_mode'] = "Teacher Aid"
-                # Removed obsolete teacher view state reset
-                st.rerun()
+            st.button("Launch Teacher Aid", key="launch_teacher_btn", use_container_width=True,
+                      on_click=set_app_mode, args=(AppMode.TEACHER_AID,))
 
     with col_utility:
         with st.container(border=True):
             st.header("💡 28-in-1 Stateless Utility Hub")
             st.markdown("Use **28 specialized AI tools** via single input, identified by immediate intent routing.")
-            if st.button("Launch 28-in-1 Hub", key="launch_utility_btn", use_container_width=True):
-                st.session_state['app_mode'] = "28-in-1 Utilities"
-                st.rerun()
+            st.button("Launch 28-in-1 Hub", key="launch_utility_btn", use_container_width=True,
+                      on_click=set_app_mode, args=(AppMode.UTILITIES,))
 
-def render_utility_hub_content(can_interact, universal_error_msg):
+def render_utility_hub_content(storage: dict, user_email: str, can_interact, universal_error_msg):
     """The 28-in-1 Stateless AI Utility Hub"""
+    ensure_db_loaded('utility_db', user_email)
 
     st.title("💡 28-in-1 Stateless AI Utility Hub")
     st.caption("Select a category, then choose a feature, and provide your input.")
@@ -792,115 +687,166 @@ def render_utility_hub_content(can_interact, universal_error_msg):
         st.error(f"🛑 **ACCESS BLOCKED:** {display_msg}. Cannot interact with the application while over your universal limit.")
         return
 
-    can_save_utility, utility_error_msg, utility_limit = check_storage_limit(st.session_state.storage, 'utility_save')
+    _render_utility_workspace(storage)
+
 
+@st.fragment
+@flushes_dirty_dbs
+def _render_utility_workspace(storage: dict):
+    """Category radio plus generator column, in one fragment so their changes rerun only this block."""
     col_left, col_right = st.columns([1, 2])
 
     # --- LEFT COLUMN: CATEGORY SELECTION ---
     with col_left:
         st.subheader("Select a Category:")
-        category_options = list(UTILITY_CATEGORIES.keys())
-
-        if st.session_state['selected_28_in_1_category'] not in category_options:
-             st.session_state['selected_28_in_1_category'] = category_options[0]
-
         selected_category = st.radio(
             "Category",
-            category_options,
+            CATEGORY_OPTIONS,
             key="28_in_1_category_radio",
-            index=category_options.index(st.session_state['selected_28_in_1_category']),
+            index=CATEGORY_INDEX.get(st.session_state['selected_28_in_1_category'], 0),
             label_visibility="collapsed"
         )
         st.session_state['selected_28_in_1_category'] = selected_category
 
     # --- RIGHT COLUMN: FEATURE SELECTION & INPUT ---
     with col_right:
-        st.subheader("Select Feature & Input:")
-        features_in_category = UTILITY_CATEGORIES[selected_category]
+        _render_utility_generator(storage, selected_category)
 
-        if st.session_state['selected_28_in_1_feature'] not in features_in_category:
-            st.session_state['selected_28_in_1_feature'] = list(features_in_category.keys())[0]
 
-        selected_feature = st.selectbox(
-            "Select a Feature/Module:",
-            list(features_in_category.keys()),
-            key="28_in_1_feature_selector",
-            index=list(features_in_category.keys()).index(st.session_state['selected_28_in_1_feature'])
-        )
-        st.session_state['selected_28_in_1_feature'] = selected_feature
+def prepare_uploaded_image(uploaded_file) -> dict:
+    """
+    Decodes, downscales and re-encodes an upload once per file, kept in session state.
+    Returns {'image': PIL image, 'data': encoded bytes, 'digest': short hash for request keys}.
+    """
+    prepared = st.session_state.get('28_in_1_prepared_upload')
+    if prepared is not None and prepared['file_id'] == uploaded_file.file_id:
+        return prepared
+
+    import hashlib
+    from PIL import Image
+    # getvalue() returns the whole upload regardless of the buffer position
+    # left over from earlier reruns, so no seek(0) is needed.
+    upload_bytes = uploaded_file.getvalue()
+    image = Image.open(BytesIO(upload_bytes))
+    image.filename = uploaded_file.name
+    # Let the JPEG decoder scale down while decoding (1/2, 1/4, 1/8), then
+    # cap the pixel count; phone photos are far larger than the model needs.
+    image_format = image.format or 'PNG'
+    image.draft('RGB', (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+    image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+    image.format = image_format
+    encoded = BytesIO()
+    image.save(encoded, format=image_format)
+
+    prepared = {
+        'file_id': uploaded_file.file_id,
+        'image': image,
+        'data': encoded.getvalue(),
+        'digest': hashlib.blake2b(upload_bytes, digest_size=8).hexdigest(),
+    }
+    st.session_state['28_in_1_prepared_upload'] = prepared
+    return prepared
 
-        example_input = FEATURE_EXAMPLES.get(selected_feature, "Enter your request here...")
-        st.markdown(f'<p class="example-text">Example: <code>{example_input}</code></p>', unsafe_allow_html=True)
 
+def _render_utility_generator(storage: dict, selected_category):
+    """Feature picker, input and output for one category (part of the workspace fragment)."""
+    can_save_utility, utility_error_msg, utility_limit = check_storage_limit_cached(storage, 'utility_save')
 
-        user_input_placeholder = "Enter your request here..."
-        if selected_feature == "9. Image-to-Calorie Estimate":
-            user_input_placeholder = "Describe the food in the image and provide any specific details (e.g., '1 cup of rice with chicken')."
+    st.subheader("Select Feature & Input:")
+    feature_options = FEATURES_BY_CATEGORY[selected_category]
+    # A feature from another category falls back to this category's first entry
+    feature_index = FEATURE_INDEX.get((selected_category, st.session_state['selected_28_in_1_feature']), 0)
 
-        needs_image = selected_feature == "9. Image-to-Calorie Estimate"
+    selected_feature = st.selectbox(
+        "Select a Feature/Module:",
+        feature_options,
+        key="28_in_1_feature_selector",
+        index=feature_index
+    )
+    st.session_state['selected_28_in_1_feature'] = selected_feature
 
-        uploaded_file = None
-        uploaded_image = None
-        if needs_image:
-            uploaded_file = st.file_uploader(
-                "Upload Image for Calorie Estimate (Feature 9 Only)",
-                type=["png", "jpg", "jpeg"],
-                key="28_in_1_image_uploader"
-            )
-            if uploaded_file:
-                uploaded_image = Image.open(uploaded_file)
-                st.image(uploaded_image, caption="Uploaded Image", use_column_width=False, width=150)
+    example_input = FEATURE_EXAMPLES.get(selected_feature, DEFAULT_PLACEHOLDER)
+    # Double-backtick span, since some examples (e.g. the Code Explainer) contain backticks
+    st.caption(f"Example: `` {example_input} ``")
 
 
-        prompt_input = st.text_area(
-            "Your Request/Input:",
-            placeholder=user_input_placeholder,
-            height=150,
-            key="28_in_1_prompt_input"
-        )
+    user_input_placeholder = FEATURE_PLACEHOLDERS.get(selected_feature, DEFAULT_PLACEHOLDER)
 
-        if st.button("Generate Result", key="28_in_1_generate_btn", use_container_width=True):
-            if not prompt_input and not (needs_image and uploaded_image): # Ensure input or image for feature 9
-                st.warning("Please enter a request or upload an image (for Feature 9).")
-            else:
-                with st.spinner(f"Running Feature: {selected_feature}..."):
+    needs_image = selected_feature == "9. Image-to-Calorie Estimate"
 
-                    generated_output = run_ai_generation(
-                        feature_function_key=selected_feature,
-                        prompt_text=prompt_input,
-                        uploaded_image=uploaded_image
-                    )
+    uploaded_file = None
+    uploaded_image = None
+    prepared_upload = {}
+    if needs_image:
+        uploaded_file = st.file_uploader(
+            "Upload Image for Calorie Estimate (Feature 9 Only)",
+            type=["png", "jpg", "jpeg"],
+            accept_multiple_files=False,
+            key="28_in_1_image_uploader"
+        )
+        if uploaded_file:
+            prepared_upload = prepare_uploaded_image(uploaded_file)
+            uploaded_image = prepared_upload['image']
+            st.image(prepared_upload['data'], caption="Uploaded Image", use_column_width=False, width=150)
 
-                    st.session_state['28_in_1_output'] = generated_output
 
-                    if can_save_utility:
-                        data_to_save = {
-                            "timestamp": pd.Timestamp.now().isoformat(),
-                            "feature": selected_feature,
-                            "input": prompt_input[:100] + "..." if len(prompt_input) > 100 else prompt_input,
-                            "output_size_bytes": calculate_mock_save_size(generated_output),
-                            "output_content": generated_output
-                        }
+    prompt_input = st.text_area(
+        "Your Request/Input:",
+        placeholder=user_input_placeholder,
+        height=150,
+        key="28_in_1_prompt_input"
+    )
 
-                        st.session_state.utility_db['history'].append(data_to_save)
-                        save_db_file(get_file_path("utility_data_", st.session_state.current_user), st.session_state.utility_db)
+    generate_clicked = st.button("Generate Result", key="28_in_1_generate_btn", use_container_width=True)
+    # Warnings and save confirmations stay above the output, which streams in below
+    status_area = st.container()
 
-                        mock_size = data_to_save["output_size_bytes"]
-                        st.session_state.storage['current_utility_storage'] += mock_size
-                        st.session_state.storage['current_universal_storage'] += mock_size
-                        save_storage_tracker(st.session_state.storage, st.session_state.current_user)
+    st.markdown("---")
+    st.subheader("Output Result")
+
+    has_input = prompt_input or (needs_image and uploaded_image) # Ensure input or image for feature 9
+    if generate_clicked and has_input:
+        with st.spinner(f"Running Feature: {selected_feature}..."):
+            generated_output = render_generation_output(run_ai_generation(
+                feature_function_key=selected_feature,
+                prompt_text=prompt_input,
+                uploaded_image=uploaded_image,
+                image_data=prepared_upload.get('data'),
+                image_digest=prepared_upload.get('digest')
+            ))
+
+        feature_outputs = st.session_state['28_in_1_outputs']
+        feature_outputs[selected_feature] = generated_output
+        feature_outputs.move_to_end(selected_feature)
+        while len(feature_outputs) > MAX_CACHED_FEATURE_OUTPUTS:
+            feature_outputs.popitem(last=False)
+
+        if can_save_utility:
+            # Sized once; reused for the record and both storage counters
+            mock_size = calculate_mock_save_size(generated_output)
+            data_to_save = {
+                "timestamp": datetime.now().isoformat(),
+                "feature": selected_feature,
+                "input": prompt_input[:100] + "..." if len(prompt_input) > 100 else prompt_input,
+                "output_size_bytes": mock_size,
+                "output_content": generated_output
+            }
 
-                        st.success(f"Result saved to Utility History (Mock Size: {mock_size} bytes).")
-                    else:
-                        st.error(f"⚠️ **Utility History Save Blocked:** {utility_error_msg}. Result is displayed below but not saved.")
+            append_history_item('utility_db', storage, 'current_utility_storage', data_to_save)
 
-        st.markdown("---")
-        st.subheader("Output Result")
-        st.markdown(st.session_state['28_in_1_output'])
+            status_area.success(f"Result saved to Utility History (Mock Size: {mock_size} bytes).")
+        else:
+            status_area.error(f"⚠️ **Utility History Save Blocked:** {utility_error_msg}. Result is displayed below but not saved.")
+    else:
+        if generate_clicked:
+            status_area.warning("Please enter a request or upload an image (for Feature 9).")
+        st.markdown(st.session_state['28_in_1_outputs'].get(selected_feature, ""))
 
 
 # --- TEACHER AID RENDERERS (FIXED TO MULTIPLE TABS) ---
-def render_teacher_aid_content(can_interact, universal_error_msg):
+def render_teacher_aid_content(storage: dict, user_email: str, can_interact, universal_error_msg):
+    ensure_db_loaded('teacher_db', user_email)
+
     st.title("🎓 Teacher Aid Hub")
     st.caption("Generate specialized educational resources using dedicated tabs for each resource type.")
     st.markdown("---")
@@ -909,274 +855,254 @@ def render_teacher_aid_content(can_interact, universal_error_msg):
         st.error(f"🛑 **ACCESS BLOCKED:** {universal_error_msg}. Cannot interact.")
         return
 
-    # Pass the save check results to the generation tab
-    can_save_teacher, teacher_error_msg, teacher_limit = check_storage_limit(st.session_state.storage, 'teacher_save')
-    
-    # Define the Resource Tags to be used as tab names
-    RESOURCE_TAGS = [
-        "Unit Overview", "Lesson Plan", "Vocabulary List", 
-        "Worksheet", "Quiz", "Test"
-    ]
-    
     # Dictionary to store outputs for each tab, to keep them separate
-    if 'teacher_outputs_by_type' not in st.session_state:
-        st.session_state['teacher_outputs_by_type'] = {tag: "" for tag in RESOURCE_TAGS}
+    st.session_state.setdefault('teacher_outputs_by_type', dict.fromkeys(RESOURCE_TAGS, ""))
 
     # Create the tabs (6 resource tabs + 1 history tab = 7 tabs)
-    tabs = st.tabs(RESOURCE_TAGS + ["📚 Saved History"])
+    tabs = st.tabs([*RESOURCE_TAGS, "📚 Saved History"])
 
-    # Loop through each resource tag to create its corresponding tab content
+    # Each tab body is its own fragment, so typing or generating in one tab
+    # does not rebuild the other tabs or the saved history table.
     for i, resource_type in enumerate(RESOURCE_TAGS):
         with tabs[i]:
-            st.subheader(f"Generate {resource_type}")
-            
-            example_input_map = {
-                "Unit Overview": f"Create a **Unit Overview** for 7th-grade history on ancient civilizations.",
-                "Lesson Plan": f"Develop a **Lesson Plan** for a high school chemistry class covering chemical reactions.",
-                "Vocabulary List": f"Generate a **Vocabulary List** for an English class on Shakespearean terminology.",
-                "Worksheet": f"Provide a **Worksheet** for pre-algebra students practicing order of operations.",
-                "Quiz": f"Make a **Quiz** on the basic functions of a plant cell.",
-                "Test": f"Create a **Test** for a 9th-grade biology course on genetics."
-            }
-            example_prompt_snippet = example_input_map.get(resource_type, f"Create a **{resource_type}** on your topic.")
-            st.markdown(f'<p class="example-text">Example Prompt: <code>{example_prompt_snippet}</code></p>', unsafe_allow_html=True)
-
-            teacher_prompt = st.text_area(
-                f"Enter your specific topic and details (The tag **{resource_type}** will be automatically added):",
-                placeholder=f"e.g., 'on the causes and effects of the American Civil War' for a {resource_type}",
-                height=150,
-                key=f"teacher_ai_prompt_{resource_type.replace(' ', '_')}"
-            )
-            
-            # The prompt sent to the AI function must contain the Resource Tag to trigger the mock/AI routing
-            final_prompt = f"{resource_type} {teacher_prompt}".strip()
-
-            if st.button(f"Generate {resource_type}", key=f"teacher_generate_btn_{resource_type.replace(' ', '_')}", use_container_width=True):
-                if not teacher_prompt:
-                    st.warning("Please enter a topic and details for the resource.")
-                    st.session_state['teacher_outputs_by_type'][resource_type] = "" 
-                    return
-
-                feature_key_proxy = "Teacher_Aid_Routing" # All teacher aid goes through this proxy
-
-                with st.spinner(f"Generating specialized {resource_type} resource..."):
-                    generated_output = run_ai_generation(
-                        feature_function_key=feature_key_proxy,
-                        prompt_text=final_prompt,
-                        uploaded_image=None
-                    )
-                    st.session_state['teacher_outputs_by_type'][resource_type] = generated_output
-
-                    if can_save_teacher:
-                        data_to_save = {
-                            "timestamp": pd.Timestamp.now().isoformat(),
-                            "request_type": resource_type, # Save the specific type
-                            "request": final_prompt[:100] + "..." if len(final_prompt) > 100 else final_prompt,
-                            "output_size_bytes": calculate_mock_save_size(generated_output),
-                            "output_content": generated_output
-                        }
-
-                        st.session_state.teacher_db['history'].append(data_to_save)
-                        save_db_file(get_file_path("teacher_data_", st.session_state.current_user), st.session_state.teacher_db)
-
-                        mock_size = data_to_save["output_size_bytes"]
-                        st.session_state.storage['current_teacher_storage'] += mock_size
-                        st.session_state.storage['current_universal_storage'] += mock_size
-                        save_storage_tracker(st.session_state.storage, st.session_state.current_user)
-
-                        st.success(f"{resource_type} saved to Teacher History (Mock Size: {mock_size} bytes).")
-                    else:
-                        st.error(f"⚠️ **Teacher History Save Blocked:** {teacher_error_msg}. Result is displayed below but not saved.")
-
-            st.markdown("---")
-            st.subheader(f"Generated {resource_type} Output")
-            if st.session_state['teacher_outputs_by_type'].get(resource_type):
-                st.markdown(st.session_state['teacher_outputs_by_type'][resource_type])
-            else:
-                st.info(f"Your generated {resource_type} will appear here.")
+            _render_teacher_generator(storage, resource_type)
 
     # --- Saved History Tab (Last tab) ---
     history_tab_index = len(RESOURCE_TAGS)
     with tabs[history_tab_index]: # Access the last tab
-        st.subheader("Teacher Aid Saved History")
-        
-        # CRITICAL FIX: Ensure all history entries have 'request_type' for display
-        teacher_history = st.session_state.teacher_db['history']
-        for item in teacher_history:
-            if 'request_type' not in item:
-                # Infer type from the prompt text for old entries
-                item['request_type'] = next((tag for tag in RESOURCE_TAGS if tag in item['request']), 'Resource')
-        
-        teacher_df = pd.DataFrame(teacher_history)
-
-        if not teacher_df.empty:
-            teacher_df['timestamp'] = pd.to_datetime(teacher_df['timestamp']).dt.strftime('%Y-%m-%d %H:%M')
-            # Drop the 'output_content' column for the main table view to keep it clean
-            display_df = teacher_df.drop(columns=['output_content'], errors='ignore')
-            display_df['request_snippet'] = display_df['request'].str.slice(0, 50) + '...'
-            
-            # Ensure 'request_type' exists for display
-            if 'request_type' not in display_df.columns:
-                 display_df['request_type'] = 'Resource'
-                 
-            st.dataframe(
-                display_df[['timestamp', 'request_type', 'request_snippet', 'output_size_bytes']].sort_values(by='timestamp', ascending=False), 
-                use_container_width=True
-            )
-            
-            history_indices = teacher_df.index.tolist()
-            if history_indices:
-                selected_row_index_teacher = st.selectbox(
-                    "Select History Item for Full Content View:", 
-                    history_indices, 
-                    format_func=lambda i: f"[{i+1}] {display_df.loc[i, 'request_type']} - {display_df.loc[i, 'request_snippet']}", 
-                    key="teacher_history_selector"
-                )
-                
-                if selected_row_index_teacher is not None and not teacher_df.empty:
-                    st.markdown("---")
-                    st.subheader("Full Resource Content")
-                    # Use a text_area for better readability of large content
-                    st.text_area(
-                        f"Content for {teacher_df.loc[selected_row_index_teacher, 'request_type']}: {teacher_df.loc[selected_row_index_teacher, 'request']}",
-                        teacher_df.loc[selected_row_index_teacher, 'output_content'],
-                        height=300,
-                        key="full_teacher_content_display"
-                    )
-        else:
-            st.info("No teacher resources have been saved yet.")
+        _render_teacher_history()
 
 
-# --- USAGE DASHBOARD RENDERER (GRAPHS RESTORED) ---
-def render_usage_dashboard():
-    st.title("📊 Usage Dashboard")
-    st.markdown("---")
-    st.subheader(f"Current Plan: {st.session_state.storage['tier']} ({TIER_PRICES.get(st.session_state.storage['tier'])})")
+@st.fragment
+@flushes_dirty_dbs
+def _render_teacher_generator(storage: dict, resource_type):
+    """Prompt, generate button and output for a single resource tab."""
+    # Pass the save check results to the generation tab
+    can_save_teacher, teacher_error_msg, teacher_limit = check_storage_limit_cached(storage, 'teacher_save')
 
-    # --- RESTORED USAGE GRAPHS (Progress Bars) ---
-    st.markdown("### Storage Usage")
+    st.subheader(f"Generate {resource_type}")
+    key_suffix = RESOURCE_KEY_SUFFIXES[resource_type]
 
-    storage_data = st.session_state.storage
-    tier = storage_data['tier']
+    example_prompt_snippet = TEACHER_EXAMPLE_PROMPTS.get(resource_type, f"Create a **{resource_type}** on your topic.")
+    st.caption(f"Example Prompt: `{example_prompt_snippet}`")
 
-    # 1. Universal Storage
-    current_uni = storage_data.get('current_universal_storage', 0)
-    limit_uni_raw = TIER_LIMITS.get(tier, {}).get('universal_storage_limit_bytes', 0)
+    teacher_prompt = st.text_area(
+        f"Enter your specific topic and details (The tag **{resource_type}** will be automatically added):",
+        placeholder=f"e.g., 'on the causes and effects of the American Civil War' for a {resource_type}",
+        height=150,
+        key=f"teacher_ai_prompt_{key_suffix}"
+    )
     
-    if limit_uni_raw == float('inf'):
-        uni_percent = 0.0 # Display 0% progress for unlimited, but show usage
-        uni_limit_display = "Unlimited"
-    else:
-        uni_limit_display = f"{int(limit_uni_raw):,}"
-        uni_percent = min(1.0, current_uni / limit_uni_raw) if limit_uni_raw > 0 else 0.0
+    # The prompt sent to the AI function must contain the Resource Tag to trigger the mock/AI routing
+    final_prompt = f"{resource_type} {teacher_prompt}".strip()
 
-    st.progress(uni_percent, text=f"**Universal Storage:** {current_uni:,} / {uni_limit_display} Bytes")
+    generate_clicked = st.button(f"Generate {resource_type}", key=f"teacher_generate_btn_{key_suffix}", use_container_width=True)
+    status_area = st.container()
 
-    # 2. Utility Storage
-    current_utility = storage_data.get('current_utility_storage', 0)
-    limit_utility_raw = TIER_LIMITS.get(tier, {}).get('utility_save_limit_bytes', 0)
-    
-    if limit_utility_raw == float('inf'):
-        utility_percent = 0.0
-        utility_limit_display = "Unlimited"
-    else:
-        utility_limit_display = f"{int(limit_utility_raw):,}"
-        utility_percent = min(1.0, current_utility / limit_utility_raw) if limit_utility_raw > 0 else 0.0
+    st.markdown("---")
+    st.subheader(f"Generated {resource_type} Output")
+
+    if generate_clicked and teacher_prompt:
+        feature_key_proxy = "Teacher_Aid_Routing" # All teacher aid goes through this proxy
+
+        with st.spinner(f"Generating specialized {resource_type} resource..."):
+            generated_output = render_generation_output(run_ai_generation(
+                feature_function_key=feature_key_proxy,
+                prompt_text=final_prompt,
+                uploaded_image=None
+            ))
+        st.session_state['teacher_outputs_by_type'][resource_type] = generated_output
+
+        if can_save_teacher:
+            # Sized once; reused for the record and both storage counters
+            mock_size = calculate_mock_save_size(generated_output)
+            data_to_save = {
+                "timestamp": datetime.now().isoformat(),
+                "request_type": resource_type, # Save the specific type
+                "request": final_prompt[:100] + "..." if len(final_prompt) > 100 else final_prompt,
+                "output_size_bytes": mock_size,
+                "output_content": generated_output
+            }
 
-    st.progress(utility_percent, text=f"**28-in-1 Utility History:** {current_utility:,} / {utility_limit_display} Bytes")
+            append_history_item('teacher_db', storage, 'current_teacher_storage', data_to_save)
 
-    # 3. Teacher Storage
-    current_teacher = storage_data.get('current_teacher_storage', 0)
-    limit_teacher_raw = TIER_LIMITS.get(tier, {}).get('teacher_save_limit_bytes', 0)
-    
-    if limit_teacher_raw == float('inf'):
-        teacher_percent = 0.0
-        teacher_limit_display = "Unlimited"
+            st.toast(f"{resource_type} saved to Teacher History (Mock Size: {mock_size} bytes).", icon="✅")
+            # The history tab is a separate fragment; rerun the app so it shows the new item.
+            st.rerun()
+        else:
+            status_area.error(f"⚠️ **Teacher History Save Blocked:** {teacher_error_msg}. Result is displayed below but not saved.")
+        return
+
+    if generate_clicked:
+        status_area.warning("Please enter a topic and details for the resource.")
+        st.session_state['teacher_outputs_by_type'][resource_type] = ""
+
+    if st.session_state['teacher_outputs_by_type'].get(resource_type):
+        st.markdown(st.session_state['teacher_outputs_by_type'][resource_type])
     else:
-        teacher_limit_display = f"{int(limit_teacher_raw):,}"
-        teacher_percent = min(1.0, current_teacher / limit_teacher_raw) if limit_teacher_raw > 0 else 0.0
+        st.info(f"Your generated {resource_type} will appear here.")
 
-    st.progress(teacher_percent, text=f"**Teacher Aid History:** {current_teacher:,} / {teacher_limit_display} Bytes")
-    
-    # 4. File Storage (Placeholder/Mock - using Teacher limit for size tracking example)
-    current_file = storage_data.get('current_file_storage', 0)
-    limit_file_raw = TIER_LIMITS.get(tier, {}).get('file_upload_limit_bytes', 0)
+
+def _infer_request_type(request_text: str) -> str:
+    """Infers the resource tag of an old history entry from its prompt text."""
+    return next((tag for tag in RESOURCE_TAGS if tag in request_text), 'Resource')
+
+
+@st.fragment
+def _render_teacher_history():
+    """Paged Teacher Aid history table and full-content viewer."""
+    st.subheader("Teacher Aid Saved History")
+    teacher_history = st.session_state.teacher_db['history']
     
-    if limit_file_raw == float('inf'):
-        file_percent = 0.0
-        file_limit_display = "Unlimited"
+    if teacher_history:
+        import pandas as pd
+        # Only the visible page is materialized; page 1 holds the newest saves.
+        total_items = len(teacher_history)
+        page_count = (total_items + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        page = 1
+        if page_count > 1:
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key="teacher_history_page")
+        page_end = total_items - (page - 1) * HISTORY_PAGE_SIZE
+        page_indices = list(range(page_end - 1, max(page_end - HISTORY_PAGE_SIZE, 0) - 1, -1))
+        st.caption(f"Showing items {total_items - page_end + 1}-{total_items - page_indices[-1]} of {total_items} (newest first).")
+
+        # Table rows carry only the summary fields; the full output is read from
+        # history for the one selected item. Older saves predate 'request_type'.
+        infer_type = _infer_request_type
+        page_rows = [
+            {
+                'timestamp': item['timestamp'],
+                'request_type': item.get('request_type') or infer_type(item['request']),
+                'request': item['request'],
+                'output_size_bytes': item.get('output_size_bytes'),
+            }
+            for item in map(teacher_history.__getitem__, page_indices)
+        ]
+        display_df = pd.DataFrame(page_rows, index=page_indices)
+        display_df['timestamp'] = pd.to_datetime(display_df['timestamp']).dt.strftime('%Y-%m-%d %H:%M')
+        display_df['request_snippet'] = display_df['request'].str.slice(0, 50) + '...'
+             
+        # Picking a row opens its full content; the table itself is the selector
+        st.caption("Select a row to view its full content (defaults to the newest on this page).")
+        selection = st.dataframe(
+            display_df[['timestamp', 'request_type', 'request_snippet', 'output_size_bytes']],
+            use_container_width=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key="teacher_history_table"
+        )
+        # Selections are positions within the page; one kept from a longer page may be out of range
+        selected_rows = selection.selection.rows
+        selected_position = selected_rows[0] if selected_rows and selected_rows[0] < len(page_indices) else 0
+        selected_row_index_teacher = page_indices[selected_position]
+
+        st.markdown("---")
+        st.subheader("Full Resource Content")
+        st.caption(f"Content for {display_df.loc[selected_row_index_teacher, 'request_type']}: {display_df.loc[selected_row_index_teacher, 'request']}")
+        # Read-only view: a scrollable container is much lighter than a text_area widget
+        with st.container(height=300, border=True):
+            st.markdown(teacher_history[selected_row_index_teacher].get('output_content', ''))
     else:
-        file_limit_display = f"{int(limit_file_raw):,}"
-        file_percent = min(1.0, current_file / limit_file_raw) if limit_file_raw > 0 else 0.0
+        st.info("No teacher resources have been saved yet.")
+
+
+# --- USAGE DASHBOARD RENDERER (GRAPHS RESTORED) ---
+def render_usage_dashboard(storage: dict, user_email: str):
+    ensure_db_loaded('utility_db', user_email)
+
+    tier = storage['tier']
+
+    st.title("📊 Usage Dashboard")
+    st.markdown("---")
+    st.subheader(f"Current Plan: {tier} ({TIER_PRICES.get(tier)})")
+
+    # --- RESTORED USAGE GRAPHS (Progress Bars) ---
+    st.markdown("### Storage Usage")
 
-    st.progress(file_percent, text=f"**File Uploads/Images:** {current_file:,} / {file_limit_display} Bytes")
+    tier_limits = TIER_LIMITS.get(tier, {})
+
+    for label, usage_key, limit_key in USAGE_BARS:
+        current = storage.get(usage_key, 0)
+        limit_raw = tier_limits.get(limit_key, 0)
+
+        if limit_raw == float('inf'):
+            percent = 0.0 # Display 0% progress for unlimited, but show usage
+            limit_display = "Unlimited"
+        else:
+            limit_display = f"{int(limit_raw):,}"
+            percent = min(1.0, current / limit_raw) if limit_raw > 0 else 0.0
+
+        st.progress(percent, text=USAGE_BAR_TEMPLATE.format(label=label, current=current, limit=limit_display))
     
     st.markdown("---")
     
     # --- History Tables (The content that was NOT deleted) ---
     st.subheader("Utility History (Last 5 Saves)")
-    utility_df = pd.DataFrame(st.session_state.utility_db['history'])
-    if not utility_df.empty:
-        st.dataframe(utility_df[['timestamp', 'feature', 'input', 'output_size_bytes']].tail(5).sort_values(by='timestamp', ascending=False), use_container_width=True)
+    # History is appended in time order, so the newest five are the last five.
+    recent_utility = st.session_state.utility_db['history'][-5:][::-1]
+    if recent_utility:
+        st.dataframe(
+            {column: [item.get(column) for item in recent_utility]
+             for column in ('timestamp', 'feature', 'input', 'output_size_bytes')},
+            use_container_width=True
+        )
     else:
         st.info("No utility history saved yet.")
 
 
 # --- PLAN MANAGER RENDERER (CONTENT RESTORED) ---
-def render_plan_manager():
+@st.fragment
+@flushes_dirty_dbs
+def render_plan_manager(storage: dict, user_email: str):
+    current_tier = storage['tier']
+
     st.title("💳 Plan Manager")
     st.markdown("---")
-    st.subheader(f"Your Current Plan: **{st.session_state.storage['tier']}**")
-    st.markdown(f"Price: **{TIER_PRICES.get(st.session_state.storage['tier'], 'N/A')}**")
+    st.subheader(f"Your Current Plan: **{current_tier}**")
+    st.markdown(f"Price: **{TIER_PRICES.get(current_tier, 'N/A')}**")
 
     st.markdown("### Choose a New Plan")
 
-    col1, col2, col3, col4, col5 = st.columns(5)
-    
-    plans_list = ["Free Tier", "28/1 Pro", "Teacher Pro", "Universal Pro", "Unlimited"]
-    cols = [col1, col2, col3, col4, col5]
-
-    for i, plan in enumerate(plans_list):
-        with cols[i]:
-            with st.container(border=True):
-                st.header(plan)
-                price = TIER_PRICES[plan]
-                st.markdown(f"**{price}**")
-                
-                # Dynamic feature descriptions (simplified)
-                if "Pro" in plan:
-                    st.markdown("✅ Enhanced Storage")
-                    if "28/1" in plan:
-                        st.markdown("✅ **28-in-1** Access")
-                        st.markdown("❌ Teacher Aid")
-                    elif "Teacher" in plan:
-                        st.markdown("❌ 28-in-1 Access")
-                        st.markdown("✅ **Teacher Aid**")
-                    elif "Universal" in plan:
-                        st.markdown("✅ Both Suites")
-                        st.markdown("✅ Dedicated Support")
-                elif plan == "Unlimited":
-                    st.markdown("🌟 Everything")
-                    st.markdown("🚀 Infinite Storage")
-                else:
-                    st.markdown("Basic Access")
-                    st.markdown("Limited Storage")
-
-                
-                if plan == st.session_state.storage['tier']:
-                    st.button("Current Plan", key=f"plan_current_{plan.replace(' ', '_')}", use_container_width=True, disabled=True)
-                else:
-                    # Restore the clickable interaction
-                    if st.button(f"Select {plan}", key=f"plan_select_{plan.replace(' ', '_')}", use_container_width=True):
-                        st.session_state.storage['tier'] = plan
-                        # NOTE: In a real app, this would trigger a payment gateway.
-                        st.success(f"Successfully selected the {plan}! (A full implementation would now process payment).")
-                        save_storage_tracker(st.session_state.storage, st.session_state.current_user)
-                        st.rerun()
+    # One table for all plans instead of a card of widgets per plan
+    st.dataframe(PLAN_TABLE, hide_index=True, use_container_width=True)
+
+    selected_plan = st.radio(
+        "Plan",
+        TIER_ORDER,
+        index=TIER_ORDER.index(current_tier) if current_tier in TIER_ORDER else 0,
+        horizontal=True,
+        key="plan_manager_choice"
+    )
+
+    if selected_plan == current_tier:
+        st.button("Current Plan", key="plan_current", use_container_width=True, disabled=True)
+    elif st.button(f"Select {selected_plan}", key="plan_select", use_container_width=True):
+        storage['tier'] = selected_plan
+        # NOTE: In a real app, this would trigger a payment gateway.
+        st.success(f"Successfully selected the {selected_plan}! (A full implementation would now process payment).")
+        mark_db_dirty('storage')
+        # Full-app rerun (not just this fragment) so the sidebar shows the new tier
+        st.rerun(scope="app")
 
 
 # --- DATA CLEAN UP RENDERER ---
-def render_data_clean_up():
+def _wipe_history(storage: dict, db_key: str, storage_key: str, label: str):
+    """on_click callback for the wipe buttons; it runs before the rerun, so no st.rerun() is needed."""
+    st.session_state[db_key]['history'] = []
+    mark_db_dirty(db_key)
+
+    # Clears this history's counter and takes the same amount off universal storage
+    adjust_storage_usage(storage, storage_key, -storage.get(storage_key, 0))
+
+    st.toast(f"{label} has been reset and storage cleared.", icon="✅")
+
+
+@st.fragment
+@flushes_dirty_dbs
+def render_data_clean_up(storage: dict, user_email: str):
+    ensure_db_loaded('utility_db', user_email)
+    ensure_db_loaded('teacher_db', user_email)
+
     st.title("🧹 Data Clean Up")
     st.markdown("---")
     st.warning("Deleting data is permanent. Use with caution.")
@@ -1184,64 +1110,53 @@ def render_data_clean_up():
     col1, col2 = st.columns(2)
 
     with col1:
-        if st.button("Wipe Utility History", key="wipe_utility_btn", use_container_width=True):
-            st.session_state.utility_db['history'] = UTILITY_DB_INITIAL['history']
-            save_db_file(get_file_path("utility_data_", st.session_state.current_user), st.session_state.utility_db)
-
-            utility_size_cleared = st.session_state.storage.get('current_utility_storage', 0)
-            st.session_state.storage['current_utility_storage'] = 0
-            st.session_state.storage['current_universal_storage'] -= utility_size_cleared
-            # Ensure universal storage doesn't go below zero
-            if st.session_state.storage['current_universal_storage'] < 0:
-                st.session_state.storage['current_universal_storage'] = 0
-            save_storage_tracker(st.session_state.storage, st.session_state.current_user)
-
-            st.success("Utility History has been reset and storage cleared.")
-            st.rerun() # Rerun to update dashboard immediately
+        st.button(
+            "Wipe Utility History", key="wipe_utility_btn", use_container_width=True,
+            on_click=_wipe_history, args=(storage, 'utility_db', 'current_utility_storage', "Utility History")
+        )
 
     with col2:
-        if st.button("Wipe Teacher History", key="wipe_teacher_btn", use_container_width=True):
-            st.session_state.teacher_db['history'] = TEACHER_DB_INITIAL['history']
-            save_db_file(get_file_path("teacher_data_", st.session_state.current_user), st.session_state.teacher_db)
-
-            teacher_size_cleared = st.session_state.storage.get('current_teacher_storage', 0)
-            st.session_state.storage['current_teacher_storage'] = 0
-            st.session_state.storage['current_universal_storage'] -= teacher_size_cleared
-            # Ensure universal storage doesn't go below zero
-            if st.session_state.storage['current_universal_storage'] < 0:
-                st.session_state.storage['current_universal_storage'] = 0
-            save_storage_tracker(st.session_state.storage, st.session_state.current_user)
-
-            st.success("Teacher History has been reset and storage cleared.")
-            st.rerun() # Rerun to update dashboard immediately
+        st.button(
+            "Wipe Teacher History", key="wipe_teacher_btn", use_container_width=True,
+            on_click=_wipe_history, args=(storage, 'teacher_db', 'current_teacher_storage', "Teacher History")
+        )
 
 
 # --- MAIN APPLICATION LOGIC ---
+# app_mode -> page renderer, so routing is one dict lookup per rerun.
+# Every page renderer takes (storage, user_email) for the logged-in user.
+PAGE_RENDERERS = {
+    AppMode.DASHBOARD: render_main_dashboard,
+    AppMode.UTILITIES: render_utility_hub_content,
+    AppMode.TEACHER_AID: render_teacher_aid_content,
+    AppMode.USAGE_DASHBOARD: render_usage_dashboard,
+    AppMode.PLAN_MANAGER: render_plan_manager,
+    AppMode.DATA_CLEAN_UP: render_data_clean_up,
+}
 
-if not st.session_state.logged_in:
-    render_login_page()
-else:
+# Bound once per rerun and passed down, so renderers don't go back through session state
+storage = st.session_state.storage
+
+try:
     # --- 1. Navigation ---
-    render_main_navigation_sidebar()
+    render_main_navigation_sidebar(storage, user_email)
 
     # Check universal access based on storage limits
-    can_interact, universal_error_msg, _ = check_storage_limit(st.session_state.storage, 'universal_storage')
+    if storage['tier'] == "Unlimited":
+        # No universal cap on this tier, so there is nothing to check
+        can_interact, universal_error_msg = True, ""
+    else:
+        can_interact, universal_error_msg, _ = check_storage_limit_cached(storage, 'universal_storage')
 
     # --- 2. Content Routing ---
-    if st.session_state.app_mode == "Dashboard":
-        render_main_dashboard()
-
-    elif st.session_state.app_mode == "28-in-1 Utilities":
-        render_utility_hub_content(can_interact, universal_error_msg)
-
-    elif st.session_state.app_mode == "Teacher Aid":
-        render_teacher_aid_content(can_interact, universal_error_msg)
-
-    elif st.session_state.app_mode == "Usage Dashboard":
-        render_usage_dashboard()
-
-    elif st.session_state.app_mode == "Plan Manager":
-        render_plan_manager()
-
-    elif st.session_state.app_mode == "Data Clean Up":
-        render_data_clean_up()
+    app_mode = st.session_state.app_mode
+    render_page = PAGE_RENDERERS.get(app_mode)
+    # The two generator hubs also take (can_interact, universal_error_msg)
+    if app_mode is AppMode.UTILITIES or app_mode is AppMode.TEACHER_AID:
+        render_page(storage, user_email, can_interact, universal_error_msg)
+    elif render_page is not None:
+        render_page(storage, user_email)
+finally:
+    # Write-behind: persist every DB touched during this run in one pass,
+    # including runs cut short by st.rerun().
+    flush_dirty_dbs()
@@ -0,0 +1,231 @@
+import streamlit as st
+import re
+import functools
+import random
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# The mock utilities and their category/example maps live here, outside the app
+# script, so they are built once per process instead of on every rerun.
+
+# --- 1. THE 28 FEATURE MOCKS (Internal Mapping for Mocking) ---
+
+# Input parsers for the calculator mocks, compiled once instead of on each call
+_BILL_RE = re.compile(r'bill:\s*[\$\s]*([\d\.]+)', re.IGNORECASE)
+_TIP_RE = re.compile(r'tip:\s*([\d\.]+)\s*%', re.IGNORECASE)
+_PEOPLE_RE = re.compile(r'people:\s*(\d+)', re.IGNORECASE)
+_SCORE_WEIGHT_RE = re.compile(r'(\w+)\s*(\d+)\s*\((\d+)%\)')
+
+# The parsing mocks are pure functions of their input, so retried prompts are memoized
+@functools.lru_cache(maxsize=256)
+def tip_split_calculator(bill_tip_people: str) -> str:
+    bill_match = _BILL_RE.search(bill_tip_people)
+    tip_match = _TIP_RE.search(bill_tip_people)
+    people_match = _PEOPLE_RE.search(bill_tip_people)
+
+    bill = float(bill_match.group(1)) if bill_match else 50.0
+    tip_percent = float(tip_match.group(1)) if tip_match else 18.0
+    people = int(people_match.group(1)) if people_match else 2
+
+    total_bill = bill * (1 + (tip_percent / 100))
+    per_person = total_bill / people
+    return f"**Feature 6: Tip & Split Calculator**\nFor Bill: ${bill:.2f}, Tip: {tip_percent:.0f}%, People: {people}\n**Total Per Person Cost: ${per_person:.2f}**"
+
+def image_to_calorie_estimate(image: "Image.Image", user_input: str) -> str:
+    st.warning("Feature 9: Image processing is mocked. A real implementation would use a vision AI model.")
+    return f"""
+**Feature 9: Image-to-Calorie Estimate**
+(Analysis for uploaded image: {image.filename if image else 'N/A'})
+**A) Portion Estimate:** One medium patty, two slices of bread, side salad.
+**B) Itemized Calorie Breakdown:**
+* Beef Patty (4oz, lean): ~200 cal
+* Whole Wheat Bread (2 slices): ~160 cal
+* Lettuce/Tomato/Dressing: ~50 cal
+**C) Final Total:** **~410 calories**
+"""
+
+def random_fact_generator(category: str) -> str:
+    facts = ["A single cloud can weigh more than 1 million pounds.", "The shortest war in history lasted only 38 to 45 minutes.", "The smell of rain is called petrichor."]
+    return f"**Feature 17: Random Fact Generator**\nCategory: {category if category else 'General'}\n**Fact:** {random.choice(facts)}"
+
+
+@functools.lru_cache(maxsize=256)
+def grade_calculator(scores_weights: str) -> str:
+    # One pass over the matches, converting each weight once for both sums
+    total_score = 0.0
+    total_weight = 0.0
+    for _, score, weight in _SCORE_WEIGHT_RE.findall(scores_weights):
+        weight_fraction = float(weight) / 100
+        total_score += float(score) * weight_fraction
+        total_weight += weight_fraction
+
+    if total_weight > 0:
+        final_grade = (total_score / total_weight) if total_weight <= 1.0 else total_score
+        return f"**Feature 28: Grade Calculator**\nBased on input, your final calculated grade is: **{final_grade:.2f}%**"
+    return f"**Feature 28: Grade Calculator**\nInput data for calculation missing or invalid. Please provide Scores and Weights (e.g., Quiz 80 (20%))."
+
+
+# Canned responses for the features whose mock only echoes the input; {input}
+# is replaced with the user's text. Features that compute something keep a
+# function in MOCK_HANDLERS below.
+MOCK_TEMPLATES = {
+    "1. Daily Schedule Optimizer": "**Feature 1: Daily Schedule Optimizer**\nTime-blocked schedule for: {input}\n9:00 AM - Focus Work, 11:00 AM - Meeting, 1:00 PM - Deep Dive Task.",
+    "2. Task Deconstruction Expert": "**Feature 2: Task Deconstruction Expert**\n3 Concrete Steps for '{input}':\n* Define scope and audience.\n* Gather resources and outline structure.\n* Draft first section and seek feedback.",
+    "3. 'Get Unstuck' Prompter": "**Feature 3: 'Get Unstuck' Prompter**\nCritical Next-Step Question for '{input}': **What is the single, 5-minute action that moves you forward right now?**",
+    "4. Habit Breaker": "**Feature 4: Habit Breaker**\n3 Environmental Changes for friction against '{input}':\n1. Move the trigger object out of sight.\n2. Set a digital blocker or reminder.\n3. Identify a healthy replacement activity.",
+    "5. One-Sentence Summarizer": "**Feature 5: One-Sentence Summarizer**\nCore Idea: The provided text discusses complex topics and requires concise distillation of its main argument.",
+    "7. Unit Converter": "**Feature 7: Unit Converter**\nPrecise conversion of '{input}':\n*10 miles is 16.0934 kilometers.*",
+    "8. Priority Spending Advisor": "**Feature 8: Priority Spending Advisor**\nConflict Analysis for '{input}':\nThis purchase conflicts directly with your goal, delaying achievement by an estimated 6 weeks due to the opportunity cost.",
+    "10. Recipe Improver": "**Feature 10: Recipe Improver**\nSimple recipe instructions for: {input}\n1. Sauté the chicken and onions until browned. 3. Add vegetables and stock. 4. Simmer for 20 minutes and serve with rice.",
+    "11. Symptom Clarifier": "**Feature 11: Symptom Clarifier**\n3 plausible benign causes for '{input}':\n1. Common seasonal allergies (pollen/dust).\n2. Mild fatigue due to poor sleep.\n3. Dehydration or temporary low blood sugar.",
+    "12. Tone Checker & Rewriter": "**Feature 12: Tone Checker & Rewriter**\nRewritten text (Desired tone: Professional):\n'I acknowledge receipt of your request and will provide the deliverable by the end of business tomorrow.'",
+    "13. Contextual Translator": "**Feature 13: Contextual Translator**\nTranslation (French, Formal Register): **'Pourriez-vous, s'il vous plaît, me donner les détails?'** (Could you, please, give me the details?)",
+    "14. Metaphor Machine": "**Feature 14: Metaphor Machine**\n3 Creative Analogies for '{input}':\n1. The cloud is a global, shared library.\n2. Information flow is like an ocean tide.\n3. The network is a massive spider web.",
+    "15. Email/Text Reply Generator": "**Feature 15: Email/Text Reply Generator**\nDrafted concise reply for: {input}\n'Thank you for bringing this up. I will review the documents immediately and ensure the changes are implemented by 3 PM today.'",
+    "16. Idea Generator/Constraint Solver": "**Feature 16: Idea Generator/Constraint Solver**\nUnique options for '{input}':\n- Idea A: Eco-friendly delivery service using electric bikes.\n- Idea B: Subscription box for local, artisanal products.\n- Idea C: Micro-consulting for remote teams.",
+    '18. "What If" Scenario Planner': """
+**Feature 18: 'What If' Scenario Planner**
+Analysis for: What if global internet access was free?
+Pros: 1. Unprecedented educational equity. 2. Massive economic growth in developing nations. 3. Accelerated scientific collaboration.
+Cons: 1. Overwhelming infrastructure cost/upkeep. 2. Exponential increase in cyber-security threats. 3. Collapse of existing telecommunication revenue models.
+""",
+    "19. Concept Simplifier": "**Feature 19: Concept Simplifier**\nExplanation of '{input}' using simple analogy:\nQuantum entanglement is like having two special coins that always land on the opposite side, no matter how far apart you take them. Observing one instantly tells you the state of the other.",
+    "20. Code Explainer": "**Feature 20: Code Explainer**\nPlain-language explanation of function:\nThis Python code snippet defines a function that takes a list of numbers, filters out any duplicates, sorts the remaining unique numbers, and returns the result.",
+    "21. Packing List Generator": """
+**Feature 21: Packing List Generator**
+Checklist for: {input}
+**Clothes:** 3 Shirts, 2 Pants, 1 Jacket, 1 Pair of Formal Shoes.
+**Essentials:** Passport, Wallet, Adapter, Phone Charger, Medications.
+**Toiletries:** Toothbrush, Paste, Shampoo (Travel size).
+""",
+    "22. Mathematics Expert AI": "**Feature 22: Mathematics Expert AI**\nAnswer, Solve, and Explain: The solution to the equation **2x + 5 = 15** is **x = 5**. (The explanation involves isolating the variable by subtracting 5 and then dividing by 2).",
+    "23. English & Literature Expert AI": "**Feature 23: English & Literature Expert AI**\nCritique/Analysis for '{input}':\nThe use of the color green in *The Great Gatsby* symbolizes the unattainable American Dream and Jay Gatsby's eternal hope for the past.",
+    "24. History & Social Studies Expert AI": "**Feature 24: History & Social Studies Expert AI**\nComprehensive Answer/Analysis for '{input}':\nThe major cause of the French Revolution was the stark inequality between the wealthy aristocracy and the impoverished Third Estate, exacerbated by famine and enlightenment ideas.",
+    "25. Foreign Language Expert AI": "**Feature 25: Foreign Language Expert AI**\nTranslation/Context for '{input}':\n*German:* **Guten Tag! Wie geht es Ihnen?** (Formal: Hello! How are you?). *Context:* Use 'Ihnen' when speaking to strangers or elders.",
+    "26. Science Expert AI": "**Feature 26: Science Expert AI**\nExplanation/Analysis for '{input}':\nPhotosynthesis is the process by which plants convert light energy, carbon dioxide, and water into glucose (food) and oxygen. Its chemical formula is **6CO₂ + 6H₂O + Light Energy → C₆H₁₂O₆ + 6O₂**.",
+    "27. Vocational & Applied Expert AI": "**Feature 27: Vocational & Applied Expert AI**\nExpert Answer for '{input}':\nPolymorphism in Python allows objects of different classes to be treated as objects of a common interface (the same function name can be used on different types of objects).",
+}
+
+# --- CATEGORY AND FEATURE MAPPING ---
+UTILITY_CATEGORIES = {
+    "Cognitive & Productivity": (
+        "1. Daily Schedule Optimizer",
+        "2. Task Deconstruction Expert",
+        "3. 'Get Unstuck' Prompter", # <--- FIXED HERE
+        "4. Habit Breaker",
+        "5. One-Sentence Summarizer",
+    ),
+    "Finance & Math": (
+        "6. Tip & Split Calculator",
+        "7. Unit Converter",
+        "8. Priority Spending Advisor",
+    ),
+    "Health & Multi-Modal": (
+        "9. Image-to-Calorie Estimate",
+        "10. Recipe Improver",
+        "11. Symptom Clarifier",
+    ),
+    "Communication & Writing": (
+        "12. Tone Checker & Rewriter",
+        "13. Contextual Translator",
+        "14. Metaphor Machine",
+        "15. Email/Text Reply Generator",
+    ),
+    "Creative & Entertainment": (
+        "16. Idea Generator/Constraint Solver",
+        "17. Random Fact Generator",
+        '18. "What If" Scenario Planner',
+    ),
+    "Tech & Logic": (
+        "19. Concept Simplifier",
+        "20. Code Explainer",
+    ),
+    "Travel & Utility": (
+        "21. Packing List Generator",
+    ),
+    "School Answers AI": (
+        "22. Mathematics Expert AI",
+        "23. English & Literature Expert AI",
+        "24. History & Social Studies Expert AI",
+        "25. Foreign Language Expert AI",
+        "26. Science Expert AI",
+        "27. Vocational & Applied Expert AI",
+        "28. Grade Calculator",
+    ),
+}
+
+# Mock features that compute their response rather than fill in a template
+MOCK_HANDLERS = {
+    "6. Tip & Split Calculator": tip_split_calculator,
+    "9. Image-to-Calorie Estimate": image_to_calorie_estimate,
+    "17. Random Fact Generator": random_fact_generator,
+    "28. Grade Calculator": grade_calculator,
+}
+
+def run_mock_feature(feature_key: str, user_input: str, image: "Image.Image" = None) -> "str | None":
+    """Mock response for a 28-in-1 feature, or None when the key is not a feature."""
+    template = MOCK_TEMPLATES.get(feature_key)
+    if template is not None:
+        return template.format(input=user_input)
+    handler = MOCK_HANDLERS.get(feature_key)
+    if handler is None:
+        return None
+    if handler is image_to_calorie_estimate:
+        return handler(image, user_input)
+    return handler(user_input)
+
+
+# Features whose live answers are meant to differ between identical requests;
+# their responses are never kept in the shared response cache
+UNCACHED_FEATURES = frozenset({"17. Random Fact Generator"})
+
+
+# Widget options and option -> index maps for the category radio and feature selectbox
+CATEGORY_OPTIONS = tuple(UTILITY_CATEGORIES)
+CATEGORY_INDEX = {category: i for i, category in enumerate(CATEGORY_OPTIONS)}
+FEATURES_BY_CATEGORY = {category: tuple(features) for category, features in UTILITY_CATEGORIES.items()}
+FEATURE_INDEX = {
+    (category, feature): i
+    for category, features in FEATURES_BY_CATEGORY.items()
+    for i, feature in enumerate(features)
+}
+
+# --- FEATURE EXAMPLE MAPPING ---
+FEATURE_EXAMPLES = {
+    "1. Daily Schedule Optimizer": "I have 4 hours for work, 1 hour for lunch, and need to read a report.",
+    "2. Task Deconstruction Expert": "My goal is to 'start a small online business'.",
+    "3. 'Get Unstuck' Prompter": "I can't figure out the opening paragraph for my essay.", # <--- FIXED HERE
+    "4. Habit Breaker": "I want to stop checking social media first thing in the morning.",
+    "5. One-Sentence Summarizer": "The theory of relativity, developed by Albert Einstein, fundamentally changed physics...",
+    "6. Tip & Split Calculator": "Bill: $75.50, Tip: 20%, People: 4",
+    "7. Unit Converter": "Convert 55 miles per hour to kilometers per hour.",
+    "8. Priority Spending Advisor": "Should I buy a new gaming console or save for a down payment on a car?",
+    "9. Image-to-Calorie Estimate": "A bowl of chili with sour cream and a cornbread muffin.",
+    "10. Recipe Improver": "Ingredients: Chicken breast, can of black beans, jar of salsa.",
+    "11. Symptom Clarifier": "I have a headache behind my eyes and mild nausea.",
+    "12. Tone Checker & Rewriter": "Original: 'I hate this process, it's so slow.' Target Tone: Formal.",
+    "13. Contextual Translator": "Translate 'It's raining cats and dogs' into Spanish, focusing on the conversational tone.",
+    "14. Metaphor Machine": "Create metaphors for the concept of 'remote work'.",
+    "15. Email/Text Reply Generator": "Message: Meeting moved to 3 PM. Reply points: Confirm, apologize for absence at 1 PM.",
+    "16. Idea Generator/Constraint Solver": "Generate 3 ideas for a mobile app using only the microphone and camera.",
+    "17. Random Fact Generator": "Give me a random fact about the Roman Empire.",
+    '18. "What If" Scenario Planner': "What if global internet access was free?",
+    "19. Concept Simplifier": "Explain the basics of Blockchain technology to a 10-year-old.",
+    "20. Code Explainer": "Explain this Python code: `def sum_list(x): return sum(x)`",
+    "21. Packing List Generator": "I'm taking a 5-day business trip to Chicago in December.",
+    "22. Mathematics Expert AI": "Solve for X: $3(x-4) = 9$. Show your steps.",
+    "23. English & Literature Expert AI": "Analyze the theme of isolation in 'The Catcher in the Rye'.",
+    "24. History & Social Studies Expert AI": "What were the primary economic effects of the Silk Road?",
+    "25. Foreign Language Expert AI": "What is the polite way to ask for the bill in Japanese?",
+    "26. Science Expert AI": "Describe the function of the Golgi apparatus in a cell.",
+    "27. Vocational & Applied Expert AI": "Explain how to properly ground an electrical outlet.",
+    "28. Grade Calculator": "Quiz 80 (20%), Midterm 75 (30%), Final 90 (50%)",
+}
+
+# Text-area placeholder per feature; features not listed use DEFAULT_PLACEHOLDER
+DEFAULT_PLACEHOLDER = "Enter your request here..."
+FEATURE_PLACEHOLDERS = {
+    "9. Image-to-Calorie Estimate": "Describe the food in the image and provide any specific details (e.g., '1 cup of rice with chicken').",
+}